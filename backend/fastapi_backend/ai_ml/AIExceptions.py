@@ -19,3 +19,8 @@ class TextSourceException(TTSException):
 class EngineException(TTSException):
     def __init__(self, message):
         super().__init__(message)
+
+
+class OutputParsingException(ValueError):
+    def __init__(self, message):
+        super().__init__(message)
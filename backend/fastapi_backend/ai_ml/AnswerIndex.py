@@ -0,0 +1,124 @@
+"""
+Per-question semantic index of already graded answers.
+
+Answers are embedded with the sentence-transformer used for MCQ evaluation.
+When a new answer is close enough (cosine similarity) to an answer already
+graded for the same question, the earlier grade can be reused instead of
+running the LLM again.
+
+Memory stays bounded: each question keeps at most `max_answers_per_question`
+embeddings (oldest overwritten first) and at most `max_questions` questions
+are indexed (least recently used dropped first).
+
+USAGE :
+--------------------------------
+from ai_ml.AnswerIndex import SemanticAnswerIndex
+index = SemanticAnswerIndex(sentence_transformer, threshold=0.95)
+key = index.question_key(question_text, rubric, max_marks)
+embedding = index.embed([student_answer])[0]
+hit = index.lookup(key, embedding)      # (grade, similarity) or None
+index.add(key, embedding, grade)
+"""
+
+import copy
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+class _QuestionAnswers:
+    def __init__(self, dim: int, capacity: int):
+        self.embeddings = np.zeros((capacity, dim), dtype=np.float32)
+        self.grades: List[Optional[dict]] = [None] * capacity
+        self.size = 0
+        self.cursor = 0
+
+    def add(self, embedding: np.ndarray, grade: dict):
+        self.embeddings[self.cursor] = embedding
+        self.grades[self.cursor] = grade
+        self.cursor = (self.cursor + 1) % len(self.grades)
+        self.size = min(self.size + 1, len(self.grades))
+
+    def best_match(self, embedding: np.ndarray) -> Tuple[int, float]:
+        scores = self.embeddings[:self.size] @ embedding
+        best = int(np.argmax(scores))
+        return best, float(scores[best])
+
+
+class SemanticAnswerIndex:
+    def __init__(
+        self,
+        encoder,
+        threshold: float = 0.95,
+        max_answers_per_question: int = 200,
+        max_questions: int = 1000,
+    ):
+        self.encoder = encoder
+        self.threshold = threshold
+        self.max_answers_per_question = max(1, max_answers_per_question)
+        self.max_questions = max(1, max_questions)
+
+        self._questions: "OrderedDict[str, _QuestionAnswers]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._lookups = 0
+        self._reused = 0
+
+    @staticmethod
+    def question_key(question_text: str, rubric, max_marks) -> str:
+        payload = json.dumps(
+            [" ".join(question_text.split()), rubric, float(max_marks)],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        embeddings = self.encoder.encode(
+            texts, convert_to_numpy=True, normalize_embeddings=True
+        )
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def lookup(self, question_key: str, embedding: np.ndarray) -> Optional[Tuple[dict, float]]:
+        with self._lock:
+            self._lookups += 1
+
+            answers = self._questions.get(question_key)
+            if answers is None or answers.size == 0:
+                return None
+
+            self._questions.move_to_end(question_key)
+            best, similarity = answers.best_match(embedding)
+
+            if similarity < self.threshold:
+                return None
+
+            self._reused += 1
+            return copy.deepcopy(answers.grades[best]), similarity
+
+    def add(self, question_key: str, embedding: np.ndarray, grade: dict):
+        with self._lock:
+            answers = self._questions.get(question_key)
+
+            if answers is None:
+                answers = _QuestionAnswers(len(embedding), self.max_answers_per_question)
+                self._questions[question_key] = answers
+
+                if len(self._questions) > self.max_questions:
+                    self._questions.popitem(last=False)
+
+            self._questions.move_to_end(question_key)
+            answers.add(embedding, copy.deepcopy(grade))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "questions": len(self._questions),
+                "answers": sum(a.size for a in self._questions.values()),
+                "lookups": self._lookups,
+                "reused": self._reused,
+            }
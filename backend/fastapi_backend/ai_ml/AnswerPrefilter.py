@@ -0,0 +1,209 @@
+"""
+Cheap pre-filter that settles trivial answers without calling the LLM.
+
+Handled in milliseconds, with a deterministic result:
+    - empty answers (no letters or digits at all)
+    - answers shorter than `min_answer_chars` (0 = off: "7" or "-5" can be right)
+    - refusals such as "I don't know" or "no idea" (rules; embeddings only
+      when an encoder is passed, they cannot tell "I am sure" from "I am not sure")
+    - exact repeats of an answer already graded for the same question (only
+      case and whitespace are ignored, "-5" and "5" are different answers)
+
+USAGE :
+--------------------------------
+from ai_ml.AnswerPrefilter import AnswerPrefilter
+prefilter = AnswerPrefilter(model_name)      # encoder=... adds the embedding refusal match
+result = prefilter.check(input_features)     # dict or None
+...
+prefilter.remember(input_features, grade)    # after an LLM grade
+"""
+
+import copy
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from ai_ml.ResultCache import ResultCache
+
+
+FILLER_WORDS = {
+    "um", "umm", "uh", "uhh", "uhm", "hmm", "hm", "erm", "er", "ah", "eh",
+    "sir", "maam", "madam", "sorry", "okay", "ok", "so", "well",
+    "really", "honestly", "actually", "basically", "like",
+}
+
+# Matched against the whole normalized answer, never a part of it
+REFUSAL_PATTERNS = [
+    re.compile(p) for p in (
+        r"(i )?(do not|dont|didnt|did not) (know|remember|understand)( (the|this|that) (answer|question)| (about )?(this|that|it))?",
+        r"(i )?(have )?no (idea|clue)( (about )?(this|that|it))?",
+        r"(i am|im|i m) not sure( (about )?(this|that|it))?",
+        r"(i )?(can not|cannot|cant|couldnt|could not) (answer|remember|recall)( (this|that|it|the answer))?",
+        r"(i )?(forgot|forget|have forgotten)( (the answer|this|that|it))?",
+        r"dunno|idk|skip( this)?( question)?|next question|no answer",
+    )
+]
+
+REFUSAL_EXAMPLES = [
+    "I don't know",
+    "I have no idea",
+    "I don't know the answer to this question",
+    "I can't remember the answer",
+    "I forgot the answer",
+    "I am not sure about this",
+]
+
+ZERO_GRADES = {
+    "empty": (
+        "The answer is empty.",
+        "No answer was given, so no marks can be awarded.",
+        "Attempt the question and explain the key points asked for.",
+    ),
+    "too_short": (
+        "The answer is too short to be evaluated.",
+        "The answer does not contain enough content to meet any rubric point.",
+        "Write a complete answer that addresses the rubric points.",
+    ),
+    "refusal": (
+        "The student indicated that they do not know the answer.",
+        "The student did not attempt the question, so no marks can be awarded.",
+        "Revise this topic and attempt an answer next time.",
+    ),
+}
+
+
+class AnswerPrefilter:
+    def __init__(
+        self,
+        model_name: str,
+        encoder=None,
+        min_answer_chars: int = 0,
+        refusal_threshold: float = 0.85,
+        refusal_max_words: int = 8,
+        max_exact_matches: int = 10000,
+    ):
+        self.model_name = model_name
+        self.encoder = encoder
+        self.min_answer_chars = min_answer_chars
+        self.refusal_threshold = refusal_threshold
+        self.refusal_max_words = refusal_max_words
+        self.max_exact_matches = max(1, max_exact_matches)
+
+        self._refusal_embeddings = None
+        if encoder is not None:
+            self._refusal_embeddings = self._embed(REFUSAL_EXAMPLES)
+
+        self._graded: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._checked = 0
+        self._saved = {reason: 0 for reason in (*ZERO_GRADES, "exact_match")}
+
+    def _embed(self, texts):
+        embeddings = self.encoder.encode(
+            texts, convert_to_numpy=True, normalize_embeddings=True
+        )
+        return np.asarray(embeddings, dtype=np.float32)
+
+    @staticmethod
+    def normalize(answer: str) -> str:
+        # only for refusal matching: symbols and filler words are dropped
+        text = answer.lower().replace("'", "").replace("’", "")
+        text = re.sub(r"[^\w\s]", " ", text)
+        return " ".join(w for w in text.split() if w not in FILLER_WORDS)
+
+    @staticmethod
+    def exact_text(answer: str) -> str:
+        # symbols are kept: a+b / a-b, x>y / x<y and 2.5 / 2 5 differ
+        return " ".join(answer.lower().split())
+
+    def _exact_key(self, input_features: dict) -> str:
+        inputs = {
+            "rubric": input_features.get("rubric"),
+            "question_text": input_features.get("question_text"),
+            "max_marks": input_features.get("max_marks"),
+            "student_answer": self.exact_text(input_features.get("student_answer", "")),
+        }
+        return ResultCache.make_key("prefilter", self.model_name, "v1", inputs)
+
+    def _is_refusal(self, normalized: str) -> bool:
+        if not normalized:
+            return False
+        if any(p.fullmatch(normalized) for p in REFUSAL_PATTERNS):
+            return True
+
+        # Embeddings only for short answers: a long answer is never a plain refusal
+        if self._refusal_embeddings is None or len(normalized.split()) > self.refusal_max_words:
+            return False
+
+        similarity = self._refusal_embeddings @ self._embed([normalized])[0]
+        return float(similarity.max()) >= self.refusal_threshold
+
+    def _zero_grade(self, reason: str) -> dict:
+        weakness, justification, improvement = ZERO_GRADES[reason]
+        return {
+            "score": 0,
+            "strengths": [],
+            "weakness": [weakness],
+            "justification": justification,
+            "suggested_improvement": improvement,
+            "prefilter_reason": reason,
+        }
+
+    #   PUBLIC API
+    def check(self, input_features: dict) -> Optional[dict]:
+        """
+        Return a deterministic grade for a trivial answer, None otherwise.
+        """
+        answer = input_features.get("student_answer", "") or ""
+
+        reason = None
+        grade = None
+
+        if not re.search(r"[^\W_]", answer):
+            reason = "empty"
+        elif len("".join(answer.split())) < self.min_answer_chars:
+            reason = "too_short"
+        elif self._is_refusal(self.normalize(answer)):
+            reason = "refusal"
+        else:
+            key = self._exact_key(input_features)
+            with self._lock:
+                graded = self._graded.get(key)
+                if graded is not None:
+                    self._graded.move_to_end(key)
+                    reason = "exact_match"
+                    grade = copy.deepcopy(graded)
+                    grade["reused"] = True
+                    grade["reuse_similarity"] = 1.0
+
+        with self._lock:
+            self._checked += 1
+            if reason is not None:
+                self._saved[reason] += 1
+
+        if reason is None:
+            return None
+
+        return grade or self._zero_grade(reason)
+
+    def remember(self, input_features: dict, grade: dict):
+        key = self._exact_key(input_features)
+
+        with self._lock:
+            self._graded[key] = copy.deepcopy(grade)
+            self._graded.move_to_end(key)
+
+            if len(self._graded) > self.max_exact_matches:
+                self._graded.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "checked": self._checked,
+                "llm_calls_saved": sum(self._saved.values()),
+                "by_reason": dict(self._saved),
+            }
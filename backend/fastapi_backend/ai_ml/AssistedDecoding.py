@@ -0,0 +1,82 @@
+"""
+Assisted (speculative) decoding with a small draft model.
+
+The draft model proposes a few tokens, the main model checks them in a single
+forward pass and keeps the longest matching run. With greedy decoding the
+output is identical to decoding with the main model alone.
+
+The MicroBatchScheduler passes the draft to `generate` as `assistant_model`
+for prompts generated on their own (transformers only supports assisted
+generation for a batch of one) and counts drafted and accepted tokens:
+
+USAGE :
+--------------------------------
+from ai_ml.ModelCreator import HFModelCreation
+draft = HFModelCreation.hf_draft_model_creator(draft_name, hf_pipeline.tokenizer)
+llm = BatchedLLM.from_llm(hf_llm, draft_model=draft)
+print(draft.stats())      # drafted, accepted, acceptance_rate, tokens_per_step
+"""
+
+import threading
+
+try:
+    import torch
+    from transformers import StoppingCriteria
+except Exception:
+    torch = None
+    StoppingCriteria = object
+
+
+class _StepCounter(StoppingCriteria):
+    """
+    Never stops; called once per main model step with every token accepted
+    in that step.
+    """
+
+    def __init__(self, draft, prompt_length: int):
+        self.draft = draft
+        self._length = prompt_length
+
+    def __call__(self, input_ids, scores, **kwargs):
+        length = input_ids.shape[1]
+        self.draft._record_step(length - self._length)
+        self._length = length
+        return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+
+class DraftModel:
+    def __init__(self, model):
+        self.model = model
+
+        self._lock = threading.Lock()
+        self._drafted = 0
+        self._steps = 0
+        self._tokens = 0
+
+        # every forward pass of the draft proposes one token
+        model.register_forward_hook(self._on_forward)
+
+    def _on_forward(self, module, inputs, output):
+        with self._lock:
+            self._drafted += 1
+
+    def _record_step(self, new_tokens: int):
+        with self._lock:
+            self._steps += 1
+            self._tokens += new_tokens
+
+    def step_counter(self, prompt_length: int) -> _StepCounter:
+        return _StepCounter(self, prompt_length)
+
+    def stats(self) -> dict:
+        with self._lock:
+            # each main step keeps the accepted draft tokens plus one of its own
+            accepted = max(0, self._tokens - self._steps)
+            return {
+                "steps": self._steps,
+                "tokens": self._tokens,
+                "drafted": self._drafted,
+                "accepted": accepted,
+                "acceptance_rate": round(accepted / self._drafted, 4) if self._drafted else 0.0,
+                "tokens_per_step": round(self._tokens / self._steps, 2) if self._steps else 0.0,
+            }
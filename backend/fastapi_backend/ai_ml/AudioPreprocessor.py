@@ -1,18 +1,53 @@
+"""
+Audio preprocessing for speech-to-text: decode to 16 kHz mono float32, trim
+silence with VAD and split into chunks.
+
+Decode modes (AudioPreprocessorConfig.decode_mode):
+    - "pipe" : PCM WAV input is read with soundfile directly (resampled in
+               process when only the rate differs). Anything else is decoded
+               by ffmpeg writing raw s16le PCM to stdout, read straight into a
+               preallocated NumPy buffer: a file on disk is read by ffmpeg
+               from its path, an upload in memory goes to the stdin of a
+               decoder from a pool of processes started ahead of time. Nothing
+               is written to disk, except for an upload ffmpeg cannot decode
+               from stdin (mp4/m4a with its index at the end), which is
+               decoded again from a temp file.
+    - "file" : ffmpeg writes `<name>_16k.wav` next to the input, which is read
+               back with soundfile (also used whenever output_wav_path is set)
+
+USAGE :
+--------------------------------
+from ai_ml.AudioPreprocessor import AudioPreprocessor
+result = AudioPreprocessor().preprocess_file("answer.webm")
+result = AudioPreprocessor().preprocess_bytes(upload_bytes, name="answer.webm")
+AudioPreprocessor().start_decoders()     # optional, at startup
+result.audio, result.chunks, result.metadata.processed_path    # None in pipe mode
+"""
+
+import atexit
+import io
+import math
 import os
+import queue
 import subprocess
+import tempfile
+import threading
+import time
 from dataclasses import dataclass
 from typing import List, Optional, Tuple
 
 import numpy as np
 import soundfile as sf
 import webrtcvad
+from scipy.signal import resample_poly
 from ai_ml.AIExceptions import *
 
 
 @dataclass
 class AudioMetadata:
-    original_path: str
-    processed_path: str
+    original_path: Optional[str]
+    # None when the audio was decoded in memory
+    processed_path: Optional[str]
     sample_rate: int
     duration_sec: float
 
@@ -23,6 +58,11 @@ class PreprocessResult:
     sample_rate: int
     metadata: AudioMetadata
     chunks: List[np.ndarray]
+    # [start, end) sample ranges of speech in the decoded audio, before
+    # trimming (None when VAD is disabled)
+    speech_segments: Optional[np.ndarray] = None
+    # samples shared by chunks i and i + 1 (0 where the cut fell between speech segments)
+    chunk_overlaps: Optional[List[int]] = None
 
 
 class AudioPreprocessorConfig:
@@ -32,19 +72,192 @@ class AudioPreprocessorConfig:
         target_channels: int = 1,
         vad_enabled: bool = True,
         vad_mode: int = 2,
+        vad_hangover_ms: int = 300,
+        vad_min_speech_ms: int = 90,
         chunk_duration_sec: float = 90.0,
+        chunk_overlap_sec: float = 1.0,
+        decode_mode: str = "pipe",
+        decoder_pool_size: int = 2,
     ):
         self.target_sample_rate = target_sample_rate
         self.target_channels = target_channels
         self.vad_enabled = vad_enabled
         self.vad_mode = vad_mode
+        # speech is padded by the hangover on both sides, shorter voiced runs are clicks
+        self.vad_hangover_ms = vad_hangover_ms
+        self.vad_min_speech_ms = vad_min_speech_ms
         self.chunk_duration_sec = chunk_duration_sec
+        self.chunk_overlap_sec = chunk_overlap_sec
+        self.decode_mode = decode_mode
+        # ffmpeg processes kept started ahead of requests (0 = spawn per decode)
+        self.decoder_pool_size = decoder_pool_size
+
+
+DECODE_MODES = ("pipe", "file")
+
+# WAV input soundfile reads without ffmpeg
+DIRECT_WAV_FORMATS = ("WAV", "WAVEX", "RF64")
+DIRECT_WAV_SUBTYPES = ("PCM_U8", "PCM_16", "PCM_24", "PCM_32", "FLOAT", "DOUBLE")
+
+VAD_FRAME_MS = 30
+VAD_CONVERT_BLOCK = 1 << 16
+
+# pipe reads grow the PCM buffer from this size (seconds of audio) when the
+# input size gives no better estimate
+MIN_PCM_BUFFER_SEC = 10
+
+_stats_lock = threading.Lock()
+_decode_stats = {
+    path: {"decodes": 0, "total_ms": 0.0, "disk_bytes_written": 0}
+    for path in ("wav_direct", *DECODE_MODES, "temp_file")
+}
+_vad_stats = {"runs": 0, "total_ms": 0.0, "input_samples": 0, "speech_samples": 0}
+
+
+def preprocess_stats() -> dict:
+    """
+    Decodes, average preprocessing latency and bytes written to disk per
+    decode path, plus warm/cold starts of the ffmpeg decoder pools.
+    """
+    with _stats_lock:
+        stats = {
+            path: {
+                "decodes": s["decodes"],
+                "avg_ms": round(s["total_ms"] / s["decodes"], 1) if s["decodes"] else 0.0,
+                "disk_bytes_written": s["disk_bytes_written"],
+            }
+            for path, s in _decode_stats.items()
+        }
+
+        runs = _vad_stats["runs"]
+        stats["vad"] = {
+            "runs": runs,
+            "avg_ms": round(_vad_stats["total_ms"] / runs, 1) if runs else 0.0,
+            "speech_ratio": round(_vad_stats["speech_samples"] / _vad_stats["input_samples"], 4)
+            if _vad_stats["input_samples"] else 0.0,
+        }
+
+    with _pools_lock:
+        pools = list(_pools.values())
+    starts = [pool.starts() for pool in pools]
+    stats["decoder_pool"] = {
+        "warm_starts": sum(warm for warm, _ in starts),
+        "cold_starts": sum(cold for _, cold in starts),
+    }
+    return stats
+
+
+def _record(path: str, started: float, disk_bytes: int = 0):
+    with _stats_lock:
+        s = _decode_stats[path]
+        s["decodes"] += 1
+        s["total_ms"] += (time.perf_counter() - started) * 1000
+        s["disk_bytes_written"] += disk_bytes
+
+
+def _spawn_decoder(cmd: List[str], with_stdin: bool = True) -> subprocess.Popen:
+    try:
+        return subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE if with_stdin else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    except FileNotFoundError as e:
+        raise AudioProcessingError("ffmpeg not found") from e
+
+
+class _DecoderPool:
+    """
+    ffmpeg processes started ahead of time, each blocked on its stdin until a
+    request hands it an input. A process decodes one input and exits, and a
+    background thread starts its replacement, so requests skip process startup.
+    Only processes taken from the pool are replaced, so it never grows past
+    `size`; a request that finds it empty spawns its own (cold) process.
+    """
+
+    def __init__(self, cmd: List[str], size: int):
+        self.cmd = cmd
+        self._ready: "queue.Queue[subprocess.Popen]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._warm = 0
+        self._cold = 0
+
+        for _ in range(size):
+            self._replace()
+
+    def _start_one(self):
+        try:
+            self._ready.put(_spawn_decoder(self.cmd))
+        except AudioProcessingError as e:
+            print("Decoder pool:", e)
+
+    def _replace(self):
+        threading.Thread(target=self._start_one, daemon=True).start()
+
+    def acquire(self) -> subprocess.Popen:
+        while True:
+            try:
+                proc = self._ready.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    self._cold += 1
+                return _spawn_decoder(self.cmd)
+
+            # a process left the pool, dead or alive: start its replacement
+            self._replace()
+            if proc.poll() is None:
+                with self._lock:
+                    self._warm += 1
+                return proc
+            proc.wait()
+
+    def starts(self) -> Tuple[int, int]:
+        with self._lock:
+            return self._warm, self._cold
+
+    def close(self):
+        while True:
+            try:
+                proc = self._ready.get_nowait()
+            except queue.Empty:
+                return
+            proc.kill()
+            proc.wait()
+
+
+_pools: dict = {}
+_pools_lock = threading.Lock()
+
+
+def _decoder_pool(cmd: List[str], size: int) -> _DecoderPool:
+    # one pool per output format, shared by every AudioPreprocessor
+    key = tuple(cmd)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = _DecoderPool(cmd, size)
+        return pool
+
+
+@atexit.register
+def _close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
 
 
 class AudioPreprocessor:
     def __init__(self, config: Optional[AudioPreprocessorConfig] = None):
         self.config = config or AudioPreprocessorConfig()
 
+    def start_decoders(self):
+        """
+        Start the ffmpeg decoder pool now rather than on the first decode.
+        """
+        if self.config.decode_mode == "pipe" and self.config.decoder_pool_size > 0:
+            _decoder_pool(self._pcm_command("pipe:0"), self.config.decoder_pool_size)
+
     def preprocess_file(
         self,
         input_path: str,
@@ -54,17 +267,133 @@ class AudioPreprocessor:
         if not os.path.isfile(input_path):
             raise AudioProcessingError(f"File not found: {input_path}")
 
+        started = time.perf_counter()
+
+        if self.config.decode_mode == "pipe" and output_wav_path is None:
+            path = "wav_direct"
+            audio = self._load_direct(input_path)
+            if audio is None:
+                # ffmpeg reads (and seeks) the file itself, it is never loaded into memory
+                path = "pipe"
+                audio = self._decode_path(input_path, os.path.getsize(input_path))
+
+            result = self._finish(audio, self.config.target_sample_rate, os.path.abspath(input_path), None)
+            _record(path, started)
+            return result
+
         wav_path = self._convert_to_pcm_wav(input_path, output_wav_path)
         audio, sr = self._load_audio(wav_path)
 
-        if self.config.vad_enabled:
-            audio = self._trim_silence_vad(audio, sr)
+        result = self._finish(audio, sr, os.path.abspath(input_path), os.path.abspath(wav_path))
+        _record("file", started, os.path.getsize(wav_path))
+        return result
+
+    def preprocess_bytes(self, data: bytes, name: Optional[str] = None) -> PreprocessResult:
+        """
+        Preprocess an upload held in memory; ffmpeg reads it from stdin.
+        """
+        if not data:
+            raise AudioProcessingError("Empty audio input")
+
+        started = time.perf_counter()
+
+        path = "wav_direct"
+        disk_bytes = 0
+        audio = self._load_direct(io.BytesIO(data))
+        if audio is None:
+            try:
+                path = "pipe"
+                audio = self._decode_pipe(data)
+            except AudioProcessingError:
+                # containers that need seeking (mp4/m4a with its index at the
+                # end, as recorded by iOS / Safari) only decode from a path
+                path = "temp_file"
+                disk_bytes = len(data)
+                audio = self._decode_temp_file(data, name)
+
+        result = self._finish(audio, self.config.target_sample_rate, name, None)
+        _record(path, started, disk_bytes)
+        return result
+
+    def _decode_temp_file(self, data: bytes, name: Optional[str]) -> np.ndarray:
+        suffix = os.path.splitext(name or "")[1]
+        fd, temp_path = tempfile.mkstemp(suffix=suffix)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            return self._decode_path(temp_path, len(data))
+        finally:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def _decode_path(self, input_path: str, input_bytes: int) -> np.ndarray:
+        proc = _spawn_decoder(self._pcm_command(input_path), with_stdin=False)
+        return self._pcm_to_audio(self._read_pcm(proc, None, input_bytes))
+
+    def _load_direct(self, source) -> Optional[np.ndarray]:
+        """
+        PCM WAV read with soundfile, resampled in process when its rate is not
+        the target rate. None when the input needs ffmpeg.
+        """
+        if self.config.target_channels != 1:
+            return None
+
+        try:
+            info = sf.info(source)
+            if info.format not in DIRECT_WAV_FORMATS or info.subtype not in DIRECT_WAV_SUBTYPES:
+                return None
+
+            if hasattr(source, "seek"):
+                source.seek(0)
+            audio, sr = sf.read(source, dtype="float32")
+        except Exception:
+            return None
 
-        chunks = self._chunk_audio(audio, sr, self.config.chunk_duration_sec)
+        if audio.ndim > 1:
+            audio = np.mean(audio, axis=1)
+
+        target = self.config.target_sample_rate
+        if sr != target:
+            # polyphase filter, e.g. 48000 -> 16000 is up 1 / down 3
+            factor = np.gcd(sr, target)
+            audio = resample_poly(audio, target // factor, sr // factor).astype(np.float32)
+
+        return audio
+
+    def _finish(
+        self,
+        audio: np.ndarray,
+        sr: int,
+        original_path: Optional[str],
+        processed_path: Optional[str],
+    ) -> PreprocessResult:
+
+        segments = None
+        if self.config.vad_enabled:
+            started = time.perf_counter()
+            input_samples = len(audio)
+            audio, segments = self._trim_silence_vad(audio, sr)
+
+            with _stats_lock:
+                _vad_stats["runs"] += 1
+                _vad_stats["total_ms"] += (time.perf_counter() - started) * 1000
+                _vad_stats["input_samples"] += input_samples
+                _vad_stats["speech_samples"] += len(audio)
+
+        # joins between trimmed speech segments are silent, the best places to cut
+        cut_points = None
+        if segments is not None and len(segments) > 1:
+            cut_points = np.cumsum(segments[:, 1] - segments[:, 0])[:-1]
+
+        chunks, overlaps = self._chunk_audio(
+            audio, sr, self.config.chunk_duration_sec, self.config.chunk_overlap_sec, cut_points
+        )
 
         metadata = AudioMetadata(
-            original_path=os.path.abspath(input_path),
-            processed_path=os.path.abspath(wav_path),
+            original_path=original_path,
+            processed_path=processed_path,
             sample_rate=sr,
             duration_sec=len(audio) / sr,
         )
@@ -74,6 +403,8 @@ class AudioPreprocessor:
             sample_rate=sr,
             metadata=metadata,
             chunks=chunks,
+            speech_segments=segments,
+            chunk_overlaps=overlaps,
         )
 
     def _convert_to_pcm_wav(self, input_path: str, output_path: Optional[str]) -> str:
@@ -101,6 +432,90 @@ class AudioPreprocessor:
 
         return output_path
 
+    def _pcm_command(self, source: str) -> List[str]:
+        # a path is read by ffmpeg itself, "pipe:0" from stdin
+        inputs = ["-i", source] if source == "pipe:0" else ["-nostdin", "-i", source]
+        return [
+            "ffmpeg",
+            "-loglevel", "error",
+            *inputs,
+            "-f", "s16le",
+            "-acodec", "pcm_s16le",
+            "-ac", str(self.config.target_channels),
+            "-ar", str(self.config.target_sample_rate),
+            "pipe:1",
+        ]
+
+    def _decode_pipe(self, data: bytes) -> np.ndarray:
+        if self.config.decoder_pool_size > 0:
+            proc = _decoder_pool(self._pcm_command("pipe:0"), self.config.decoder_pool_size).acquire()
+        else:
+            proc = _spawn_decoder(self._pcm_command("pipe:0"))
+
+        return self._pcm_to_audio(self._read_pcm(proc, data, len(data)))
+
+    def _pcm_to_audio(self, pcm: np.ndarray) -> np.ndarray:
+        audio = pcm.astype(np.float32) / 32768.0
+
+        channels = self.config.target_channels
+        if channels > 1:
+            audio = audio[:len(audio) - len(audio) % channels].reshape(-1, channels).mean(axis=1)
+
+        return audio
+
+    def _read_pcm(self, proc: subprocess.Popen, data: Optional[bytes], input_bytes: int) -> np.ndarray:
+        """
+        Read the s16le stdout of a decoder into a preallocated int16 buffer,
+        doubled whenever it fills up. `data` is written to its stdin.
+        """
+        bytes_per_sec = self.config.target_sample_rate * self.config.target_channels * 2
+        # compressed audio decodes to more PCM bytes than it takes, WAV to about as many
+        capacity = max(2 * input_bytes, MIN_PCM_BUFFER_SEC * bytes_per_sec)
+        buffer = np.empty(capacity // 2, dtype=np.int16)
+
+        writer = None
+        if data is not None:
+            # feed stdin from a thread so a full stdout pipe cannot deadlock us
+            def feed():
+                try:
+                    proc.stdin.write(data)
+                except (BrokenPipeError, OSError):
+                    pass
+                finally:
+                    try:
+                        proc.stdin.close()
+                    except OSError:
+                        pass
+
+            writer = threading.Thread(target=feed, daemon=True)
+            writer.start()
+
+        filled = 0
+        try:
+            while True:
+                view = memoryview(buffer).cast("B")
+                if filled == len(view):
+                    buffer = np.concatenate([buffer, np.empty_like(buffer)])
+                    continue
+
+                read = proc.stdout.readinto(view[filled:])
+                if not read:
+                    break
+                filled += read
+        finally:
+            proc.stdout.close()
+            stderr = proc.stderr.read()
+            proc.stderr.close()
+            proc.wait()
+            if writer is not None:
+                writer.join()
+
+        if proc.returncode != 0:
+            raise AudioProcessingError(stderr.decode(errors="replace"))
+
+        # an odd trailing byte is half a sample
+        return buffer[:filled // 2]
+
     def _load_audio(self, wav_path: str) -> Tuple[np.ndarray, int]:
         try:
             audio, sr = sf.read(wav_path, dtype="float32")
@@ -112,38 +527,107 @@ class AudioPreprocessor:
 
         return audio, sr
 
-    def _trim_silence_vad(self, audio: np.ndarray, sr: int) -> np.ndarray:
+    def _speech_segments(self, audio: np.ndarray, sr: int) -> np.ndarray:
+        """
+        [start, end) sample ranges of speech, shape (n, 2). WebRTC VAD marks
+        each 30 ms frame; voiced runs shorter than vad_min_speech_ms are
+        dropped, the rest are padded by vad_hangover_ms on both sides and
+        merged where they overlap.
+        """
+        frame_len = sr * VAD_FRAME_MS // 1000
+        num_frames = len(audio) // frame_len
+        if num_frames == 0:
+            return np.empty((0, 2), dtype=np.int64)
+
+        # one int16 copy of the signal, converted in blocks so no float temporary
+        # of the whole signal is made; every frame is a zero-copy view of it
+        pcm = np.empty(num_frames * frame_len, dtype=np.int16)
+        for start in range(0, len(pcm), VAD_CONVERT_BLOCK):
+            block = audio[start:min(start + VAD_CONVERT_BLOCK, len(pcm))]
+            pcm[start:start + len(block)] = np.clip(block * 32767, -32767, 32767)
+        frames = memoryview(pcm).cast("B")
+        step = frame_len * 2
+
         vad = webrtcvad.Vad(self.config.vad_mode)
-        frame_ms = 30
-        frame_len = int(sr * frame_ms / 1000)
+        voiced = np.fromiter(
+            (vad.is_speech(frames[i * step:(i + 1) * step], sr) for i in range(num_frames)),
+            dtype=bool,
+            count=num_frames,
+        )
 
-        audio_bytes = (audio * 32768).astype(np.int16).tobytes()
-        voiced = []
+        # voiced runs as [start, end) frame indices
+        edges = np.diff(voiced.astype(np.int8), prepend=0, append=0)
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
 
-        num_frames = len(audio_bytes) // (frame_len * 2)
-        for i in range(num_frames):
-            start = i * frame_len * 2
-            end = start + frame_len * 2
-            frame = audio_bytes[start:end]
-            if vad.is_speech(frame, sr):
-                voiced.append(frame)
+        keep = ends - starts >= math.ceil(self.config.vad_min_speech_ms / VAD_FRAME_MS)
+        starts, ends = starts[keep], ends[keep]
+        if len(starts) == 0:
+            return np.empty((0, 2), dtype=np.int64)
 
-        if not voiced:
-            return audio
+        hangover = round(self.config.vad_hangover_ms / VAD_FRAME_MS)
+        starts = np.maximum(starts - hangover, 0)
+        ends = np.minimum(ends + hangover, num_frames)
 
-        out = b"".join(voiced)
-        return np.frombuffer(out, dtype=np.int16).astype(np.float32) / 32768.0
+        # padding can make neighbouring runs overlap, merge them
+        first = np.concatenate(([True], starts[1:] > ends[:-1]))
+        groups = np.flatnonzero(first)
+        segments = np.stack([starts[groups], np.maximum.reduceat(ends, groups)], axis=1) * frame_len
+
+        # the partial frame at the end belongs to speech that runs up to it
+        if segments[-1, 1] == num_frames * frame_len:
+            segments[-1, 1] = len(audio)
+
+        return segments
+
+    def _trim_silence_vad(self, audio: np.ndarray, sr: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Speech of `audio` gathered with one copy, and its segments.
+        Audio without detected speech is returned untrimmed.
+        """
+        segments = self._speech_segments(audio, sr)
+        if len(segments) == 0:
+            return audio, segments
+
+        return np.concatenate([audio[start:end] for start, end in segments]), segments
 
     @staticmethod
-    def _chunk_audio(audio: np.ndarray, sr: int, max_sec: float) -> List[np.ndarray]:
+    def _chunk_audio(
+        audio: np.ndarray,
+        sr: int,
+        max_sec: float,
+        overlap_sec: float = 0.0,
+        cut_points: Optional[np.ndarray] = None,
+    ) -> Tuple[List[np.ndarray], List[int]]:
+        """
+        Chunks of at most `max_sec` and the overlap (samples) after each one.
+        A chunk ends at the last cut point in the second half of its window,
+        otherwise mid-speech with `overlap_sec` shared with the next chunk.
+        """
         if audio.size == 0 or max_sec <= 0:
-            return [audio]
+            return [audio], []
 
         max_samples = int(sr * max_sec)
         if len(audio) <= max_samples:
-            return [audio]
+            return [audio], []
 
-        return [
-            audio[i:i + max_samples]
-            for i in range(0, len(audio), max_samples)
-        ]
+        overlap = min(int(sr * overlap_sec), max_samples // 2)
+        cuts = np.asarray(cut_points if cut_points is not None else [], dtype=np.int64)
+
+        chunks, overlaps = [], []
+        start = 0
+        while start + max_samples < len(audio):
+            end = start + max_samples
+
+            candidates = cuts[(cuts > start + max_samples // 2) & (cuts <= end)]
+            if len(candidates):
+                end = next_start = int(candidates[-1])
+            else:
+                next_start = end - overlap
+
+            chunks.append(audio[start:end])
+            overlaps.append(end - next_start)
+            start = next_start
+
+        chunks.append(audio[start:])
+        return chunks, overlaps
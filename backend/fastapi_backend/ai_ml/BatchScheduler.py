@@ -0,0 +1,388 @@
+"""
+Dynamic micro-batching for the shared LLM pipeline.
+
+Concurrent prompts are collected for a short window (or until the batch is
+full) and run as one padded `generate` call, then each result is handed
+back to its caller.
+
+USAGE :
+--------------------------------
+from ai_ml.BatchScheduler import BatchedLLM
+llm = BatchedLLM.from_llm(hf_llm, max_batch_size=8, batch_window_ms=25)
+chain = prompt | llm          # drop-in replacement for the HuggingFacePipeline
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import Generation, GenerationChunk, LLMResult
+
+from ai_ml.ConstrainedDecoding import JSON_SCHEMA_OPTION, JsonSchemaConstraint
+from ai_ml.GenerationControl import STOP_AT_JSON_END_OPTION, JsonObjectEndCriteria
+from ai_ml.PrefixCache import PROMPT_PREFIX_OPTION, PrefixKVCache
+from ai_ml.Cancellation import CancellationCriteria, GenerationCancelled, current_cancellation
+
+# options handled by the scheduler itself, never passed to the backend as-is
+SCHEDULER_OPTIONS = (JSON_SCHEMA_OPTION, STOP_AT_JSON_END_OPTION, PROMPT_PREFIX_OPTION)
+
+
+class _PendingPrompt:
+    def __init__(self, prompt: str, pipeline_kwargs: Dict[str, Any]):
+        self.prompt = prompt
+        self.pipeline_kwargs = pipeline_kwargs
+        self.batch_key = self._make_batch_key(pipeline_kwargs)
+        self.future: Future = Future()
+        # cancellation token of the request that submitted the prompt
+        self.token = current_cancellation()
+
+    def cancelled(self) -> bool:
+        return self.token is not None and self.token.is_cancelled()
+
+    @staticmethod
+    def _make_batch_key(pipeline_kwargs: Dict[str, Any]):
+        """
+        Prompts can only share a batch when their generation kwargs are equal.
+        Kwargs holding objects (streamers, stopping criteria...) run alone.
+        """
+        items = []
+        for key, value in sorted(pipeline_kwargs.items()):
+            if not isinstance(value, (str, int, float, bool, type(None))):
+                return None
+            items.append((key, value))
+        return tuple(items)
+
+
+class MicroBatchScheduler:
+    def __init__(self, llm, max_batch_size: int = 8, batch_window_ms: float = 25,
+                 prefix_cache: bool = False, draft_model=None):
+        self.llm = llm
+        # ai_ml.AssistedDecoding.DraftModel for assisted generation, or None
+        self.draft_model = draft_model
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_window = max(0.0, batch_window_ms) / 1000
+
+        self._queue: "queue.Queue[_PendingPrompt]" = queue.Queue()
+        self._backlog: deque = deque()
+        self._lock = threading.Lock()
+
+        self._constraint = None
+        # built on first use, False when disabled or unavailable
+        self._prefix_cache = None if prefix_cache else False
+
+        self._batches = 0
+        self._prompts = 0
+        self._largest_batch = 0
+        self._generated_tokens = 0
+        self._generate_seconds = 0.0
+        self._cancelled = 0
+
+        self._worker = threading.Thread(
+            target=self._run, name="llm-batch-scheduler", daemon=True
+        )
+        self._worker.start()
+
+    #   PUBLIC API
+    def submit(self, prompt: str, pipeline_kwargs: Optional[Dict[str, Any]] = None) -> Future:
+        pending = _PendingPrompt(prompt, dict(pipeline_kwargs or {}))
+        self._queue.put(pending)
+        return pending.future
+
+    def stream(self, prompt: str, pipeline_kwargs: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        """
+        Generate one prompt on its own and yield text as it is decoded.
+        The generation still runs on the scheduler thread, in queue order.
+        """
+        hf_pipeline = getattr(self.llm, "pipeline", None)
+
+        if hf_pipeline is None:
+            yield self.submit(prompt, pipeline_kwargs).result()
+            return
+
+        from transformers import TextIteratorStreamer
+
+        streamer = TextIteratorStreamer(
+            hf_pipeline.tokenizer, skip_prompt=True, skip_special_tokens=True
+        )
+        future = self.submit(prompt, {**(pipeline_kwargs or {}), "streamer": streamer})
+
+        # unblock the consumer if generation fails before the streamer ends
+        future.add_done_callback(lambda f: f.exception() is not None and streamer.end())
+
+        for text in streamer:
+            yield text
+
+        future.result()
+
+    def stats(self) -> dict:
+        prefix_cache = self._prefix_cache.stats() if self._prefix_cache else None
+
+        with self._lock:
+            batches = self._batches
+            return {
+                "max_batch_size": self.max_batch_size,
+                "batch_window_ms": self.batch_window * 1000,
+                "queued": self._queue.qsize() + len(self._backlog),
+                "batches": batches,
+                "prompts": self._prompts,
+                "largest_batch": self._largest_batch,
+                "avg_batch_size": round(self._prompts / batches, 2) if batches else 0.0,
+                "generated_tokens": self._generated_tokens,
+                "avg_tokens_per_prompt": round(self._generated_tokens / self._prompts, 2) if self._prompts else 0.0,
+                "cancelled_prompts": self._cancelled,
+                "tokens_per_second": round(self._generated_tokens / self._generate_seconds, 2) if self._generate_seconds else 0.0,
+                "prefix_cache": prefix_cache,
+                "assisted_decoding": self.draft_model.stats() if self.draft_model is not None else None,
+            }
+
+    #   WORKER
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self._execute(batch)
+
+    def _collect(self) -> List[_PendingPrompt]:
+        first = self._backlog.popleft() if self._backlog else self._queue.get()
+        if first.batch_key is None:
+            return [first]
+
+        batch = [first]
+
+        # Prompts deferred from an earlier window go first
+        for pending in list(self._backlog):
+            if len(batch) >= self.max_batch_size:
+                break
+            if pending.batch_key == first.batch_key:
+                self._backlog.remove(pending)
+                batch.append(pending)
+
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+
+            if pending.batch_key == first.batch_key:
+                batch.append(pending)
+            else:
+                self._backlog.append(pending)
+
+        return batch
+
+    def _fail_cancelled(self, batch: List[_PendingPrompt]) -> List[_PendingPrompt]:
+        """
+        Fail the prompts whose request was cancelled, return the others.
+        """
+        live = []
+        for pending in batch:
+            if pending.cancelled():
+                pending.future.set_exception(GenerationCancelled(pending.token.reason))
+                with self._lock:
+                    self._cancelled += 1
+            else:
+                live.append(pending)
+        return live
+
+    def _execute(self, batch: List[_PendingPrompt]):
+        batch = self._fail_cancelled(batch)
+        if not batch:
+            return
+
+        prompts = [pending.prompt for pending in batch]
+        tokens = [pending.token for pending in batch]
+
+        start = time.perf_counter()
+        try:
+            outputs = self._generate(prompts, batch[0].pipeline_kwargs, tokens)
+            elapsed = time.perf_counter() - start
+            generated = self._count_tokens(outputs)
+        except Exception as e:
+            for pending in batch:
+                pending.future.set_exception(e)
+            return
+
+        with self._lock:
+            self._batches += 1
+            self._prompts += len(batch)
+            self._largest_batch = max(self._largest_batch, len(batch))
+            self._generated_tokens += generated
+            self._generate_seconds += elapsed
+
+        # rows stopped by their cancellation token hold partial output
+        for pending, output in zip(batch, outputs):
+            if pending.cancelled():
+                self._fail_cancelled([pending])
+            else:
+                pending.future.set_result(output)
+
+    def _count_tokens(self, outputs: List[str]) -> int:
+        hf_pipeline = getattr(self.llm, "pipeline", None)
+        if hf_pipeline is None:
+            if hasattr(self.llm, "generate_with_options"):
+                return sum(self.llm.get_num_tokens(output) for output in outputs)
+            return 0
+        encoded = hf_pipeline.tokenizer(outputs, add_special_tokens=False)["input_ids"]
+        return sum(len(ids) for ids in encoded)
+
+    def _expand_options(self, hf_pipeline, prompts: List[str], pipeline_kwargs: Dict[str, Any],
+                        tokens: Optional[List[Any]] = None) -> Dict[str, Any]:
+        """
+        Turn high-level generation options into transformers generate kwargs.
+        """
+        kwargs = dict(pipeline_kwargs)
+
+        prefix = kwargs.pop(PROMPT_PREFIX_OPTION, None)
+        # left padding shifts the prefix in a batch, so only single prompts reuse it
+        if prefix and len(prompts) == 1:
+            past_key_values = self._prefix_past(hf_pipeline, prompts[0], prefix)
+            if past_key_values is not None:
+                kwargs["past_key_values"] = past_key_values
+
+        schema = kwargs.pop(JSON_SCHEMA_OPTION, None)
+        if schema is not None:
+            if self._constraint is None:
+                try:
+                    self._constraint = JsonSchemaConstraint(hf_pipeline.tokenizer)
+                except ImportError as e:
+                    print("Constrained decoding disabled:", e)
+                    self._constraint = False
+
+            # one enforcer per generate call, it is shared by the whole batch
+            if self._constraint:
+                kwargs["prefix_allowed_tokens_fn"] = self._constraint.prefix_allowed_tokens_fn(schema)
+
+        stop_at_json_end = kwargs.pop(STOP_AT_JSON_END_OPTION, False)
+        # transformers only supports assisted generation for a batch of one
+        assisted = self.draft_model is not None and len(prompts) == 1
+
+        criteria = []
+        if tokens and any(token is not None for token in tokens):
+            criteria.append(CancellationCriteria(tokens))
+
+        if stop_at_json_end or assisted:
+            prompt_length = self._prompt_length(hf_pipeline, prompts)
+            if stop_at_json_end:
+                criteria.append(JsonObjectEndCriteria(hf_pipeline.tokenizer, prompt_length))
+            if assisted:
+                kwargs["assistant_model"] = self.draft_model.model
+                criteria.append(self.draft_model.step_counter(prompt_length))
+
+        if criteria:
+            from transformers import StoppingCriteriaList
+
+            kwargs["stopping_criteria"] = StoppingCriteriaList(criteria)
+
+        return kwargs
+
+    @staticmethod
+    def _prompt_length(hf_pipeline, prompts: List[str]) -> int:
+        # prompts are left padded to the longest one, generated tokens follow it
+        return max(len(ids) for ids in hf_pipeline.tokenizer(prompts)["input_ids"])
+
+    def _prefix_past(self, hf_pipeline, prompt: str, prefix: str):
+        if self._prefix_cache is None:
+            try:
+                self._prefix_cache = PrefixKVCache(hf_pipeline)
+            except ImportError as e:
+                print("Prefix cache disabled:", e)
+                self._prefix_cache = False
+
+        if not self._prefix_cache:
+            return None
+
+        try:
+            return self._prefix_cache.past_key_values(prompt, prefix)
+        except Exception as e:
+            print("Prefix cache disabled:", e)
+            self._prefix_cache = False
+            return None
+
+    def _generate(self, prompts: List[str], pipeline_kwargs: Dict[str, Any],
+                  tokens: Optional[List[Any]] = None) -> List[str]:
+        hf_pipeline = getattr(self.llm, "pipeline", None)
+
+        if hf_pipeline is None and hasattr(self.llm, "generate_with_options"):
+            # backends applying the options themselves (llama.cpp), one prompt at a time
+            tokens = tokens or [None] * len(prompts)
+            return [
+                self.llm.generate_with_options(
+                    prompt, pipeline_kwargs, cancelled=token.is_cancelled if token is not None else None
+                )
+                for prompt, token in zip(prompts, tokens)
+            ]
+
+        if hf_pipeline is None:
+            pipeline_kwargs = {
+                k: v for k, v in pipeline_kwargs.items() if k not in SCHEDULER_OPTIONS
+            }
+            # Non transformers backend: let LangChain run the prompts
+            extra = {"pipeline_kwargs": pipeline_kwargs} if pipeline_kwargs else {}
+            result = self.llm.generate(prompts, **extra)
+            return [generation[0].text for generation in result.generations]
+
+        kwargs = self._expand_options(hf_pipeline, prompts, pipeline_kwargs, tokens)
+
+        try:
+            responses = hf_pipeline(prompts, batch_size=len(prompts), **kwargs)
+        except Exception as e:
+            if "past_key_values" not in kwargs:
+                raise
+            # models whose remote code cannot continue from a cache object
+            print("Prefix cache disabled:", e)
+            self._prefix_cache = False
+            kwargs = self._expand_options(hf_pipeline, prompts, pipeline_kwargs, tokens)
+            responses = hf_pipeline(prompts, batch_size=len(prompts), **kwargs)
+
+        outputs = []
+        for response in responses:
+            if isinstance(response, list):
+                response = response[0]
+            outputs.append(response["generated_text"])
+        return outputs
+
+
+class BatchedLLM(LLM):
+    """
+    LangChain LLM that routes every prompt through a MicroBatchScheduler.
+    """
+
+    scheduler: Any
+
+    @classmethod
+    def from_llm(cls, llm, max_batch_size: int = 8, batch_window_ms: float = 25,
+                 prefix_cache: bool = False, draft_model=None) -> "BatchedLLM":
+        return cls(scheduler=MicroBatchScheduler(
+            llm, max_batch_size, batch_window_ms, prefix_cache, draft_model
+        ))
+
+    @property
+    def _llm_type(self) -> str:
+        return "batched_llm"
+
+    def _call(self, prompt: str, stop=None, run_manager=None, **kwargs: Any) -> str:
+        return self.scheduler.submit(prompt, kwargs.get("pipeline_kwargs")).result()
+
+    def _stream(self, prompt: str, stop=None, run_manager=None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        for text in self.scheduler.stream(prompt, kwargs.get("pipeline_kwargs")):
+            chunk = GenerationChunk(text=text)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def _generate(self, prompts: List[str], stop=None, run_manager=None, **kwargs: Any) -> LLMResult:
+        # Submit everything first so a chain.batch() lands in one window
+        futures = [
+            self.scheduler.submit(prompt, kwargs.get("pipeline_kwargs"))
+            for prompt in prompts
+        ]
+        return LLMResult(
+            generations=[[Generation(text=future.result())] for future in futures]
+        )
@@ -0,0 +1,85 @@
+"""
+Optimized CPU inference mode for the transformers LLM.
+
+Modes (LLM_CPU_OPTIMIZATION):
+    - ""     : current load path (torch_dtype="auto", device_map="auto")
+    - "bf16" : bfloat16 weights on CPU
+    - "int8" : float32 load, then dynamic int8 quantization of every Linear
+
+Both optimized modes use SDPA attention and run generate inside
+torch.inference_mode; torch.compile is optional on top.
+
+USAGE :
+--------------------------------
+from ai_ml.CPUOptimization import load_kwargs, optimize_model, resident_memory_mb
+model = AutoModelForCausalLM.from_pretrained(name, **load_kwargs("int8"))
+model = optimize_model(model, "int8", compile_model=False)
+print(resident_memory_mb())
+
+python benchmarks/cpu_optimization.py compares load time, memory and latency
+of the modes.
+"""
+
+import os
+import resource
+
+try:
+    import torch
+except Exception:
+    torch = None
+
+
+CPU_OPTIMIZATION_MODES = ("bf16", "int8")
+
+
+def resident_memory_mb() -> float:
+    """
+    Current resident set size of this process, peak RSS when /proc is missing.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except Exception:
+        # ru_maxrss is in KB on Linux
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def load_kwargs(mode: str) -> dict:
+    """
+    from_pretrained kwargs for a mode.
+    """
+    if mode not in CPU_OPTIMIZATION_MODES:
+        return {"torch_dtype": "auto", "device_map": "auto"}
+
+    return {
+        # int8 dynamic quantization needs float32 Linear layers
+        "torch_dtype": torch.bfloat16 if mode == "bf16" else torch.float32,
+        "device_map": "cpu",
+        "attn_implementation": "sdpa",
+        "low_cpu_mem_usage": True,
+    }
+
+
+def optimize_model(model, mode: str, compile_model: bool = False):
+    if mode not in CPU_OPTIMIZATION_MODES:
+        return model
+
+    model.eval()
+
+    if mode == "int8":
+        # in place: a copy would hold the float32 weights twice while loading
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+
+    # no autograd bookkeeping at all while generating
+    model.generate = torch.inference_mode()(model.generate)
+
+    if compile_model:
+        try:
+            model.forward = torch.compile(model.forward, dynamic=True)
+        except Exception as e:
+            print("torch.compile skipped:", e)
+
+    return model
@@ -0,0 +1,116 @@
+"""
+Cancellation of model work whose client is gone or whose deadline passed.
+
+A CancellationToken is created per HTTP request and made current with a
+context variable; model code running for that request (in executor threads
+and LangChain batch threads, which copy the context) checks it:
+
+    - CancellationCriteria        : stopping criterion for LLM generate calls,
+                                    one token per batch row
+    - install_cancellation_hook   : forward pre-hook on torch modules (Whisper
+                                    encoder/decoder), raises GenerationCancelled
+
+USAGE :
+--------------------------------
+from ai_ml.Cancellation import CancellationToken, current_token, current_cancellation
+token = CancellationToken(timeout=60)
+reset = current_token.set(token)
+...
+current_cancellation().raise_if_cancelled()
+"""
+
+import threading
+import time
+from contextvars import ContextVar
+from typing import List, Optional
+
+try:
+    import torch
+    from transformers import StoppingCriteria
+except Exception:
+    torch = None
+    StoppingCriteria = object
+
+
+class GenerationCancelled(Exception):
+    def __init__(self, reason: str):
+        super().__init__(f"Request cancelled: {reason}")
+        self.reason = reason
+
+
+_stats_lock = threading.Lock()
+_cancelled_requests = {"disconnect": 0, "deadline": 0}
+
+
+def cancellation_stats() -> dict:
+    with _stats_lock:
+        return {"cancelled_requests": dict(_cancelled_requests)}
+
+
+class CancellationToken:
+    def __init__(self, timeout: Optional[float] = None):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.reason: Optional[str] = None
+        self._finished = False
+        self._lock = threading.Lock()
+
+    def cancel(self, reason: str = "disconnect"):
+        with self._lock:
+            if self.reason is not None or self._finished:
+                return
+            self.reason = reason
+
+        with _stats_lock:
+            _cancelled_requests[reason] = _cancelled_requests.get(reason, 0) + 1
+
+    def finish(self):
+        """
+        The response was sent; later disconnects or deadlines are not cancellations.
+        """
+        with self._lock:
+            self._finished = True
+
+    def is_cancelled(self) -> bool:
+        if self.reason is None and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+        return self.reason is not None
+
+    def raise_if_cancelled(self):
+        if self.is_cancelled():
+            raise GenerationCancelled(self.reason)
+
+
+current_token: ContextVar[Optional[CancellationToken]] = ContextVar("cancellation_token", default=None)
+
+
+def current_cancellation() -> Optional[CancellationToken]:
+    return current_token.get()
+
+
+class CancellationCriteria(StoppingCriteria):
+    """
+    Stops the batch rows whose request was cancelled.
+    """
+
+    def __init__(self, tokens: List[Optional[CancellationToken]]):
+        self.tokens = tokens
+
+    def __call__(self, input_ids, scores, **kwargs):
+        done = [token is not None and token.is_cancelled() for token in self.tokens]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+def _raise_if_cancelled(module, args):
+    token = current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def install_cancellation_hook(*modules):
+    """
+    Make every forward pass of `modules` stop the current request's work once
+    it is cancelled (Whisper runs one decoder pass per token).
+    """
+    for module in modules:
+        if module is not None:
+            module.register_forward_pre_hook(_raise_if_cancelled)
@@ -0,0 +1,199 @@
+"""
+Two-tier (cascade) answer evaluation.
+
+A cheap first tier grades every answer and reports a confidence in [0, 1].
+Only answers whose confidence is below the threshold, or whose small-tier
+output fails validation, are escalated to the large EvaluationEngine.
+
+First tier options:
+    - RubricSimilarityScorer : sentence-transformer similarity of the answer
+                               to every rubric point (no generation at all)
+    - SmallModelScorer       : an EvaluationEngine running a small local LLM
+
+USAGE :
+--------------------------------
+from ai_ml.CascadeEvaluation import CascadeEvaluator, RubricSimilarityScorer
+cascade = CascadeEvaluator(RubricSimilarityScorer(encoder), large_engine)
+result = cascade.evaluate(input_features)
+print(result["grading_tier"], cascade.stats())
+"""
+
+import re
+import threading
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+
+REQUIRED_KEYS = ["score", "strengths", "weakness",
+                 "justification", "suggested_improvement"]
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?;])\s+|\n+")
+
+
+class RubricSimilarityScorer:
+    """
+    A rubric point counts as met when some sentence of the answer is at least
+    `high` similar to it and as missed when nothing reaches `low`. Points in
+    between are undecided; confidence is the share of decided points.
+    """
+
+    def __init__(self, encoder, high: float = 0.7, low: float = 0.3):
+        self.encoder = encoder
+        self.high = high
+        self.low = low
+
+    def _sentences(self, answer: str) -> List[str]:
+        sentences = [s.strip() for s in SENTENCE_SPLIT.split(answer) if s.strip()]
+        return sentences + [answer.strip()]
+
+    def score_batch(self, inputs: List[dict]) -> List[Tuple[dict, float]]:
+        # One encode call for every rubric point and answer sentence of the batch
+        texts, spans = [], []
+        for features in inputs:
+            rubric = [r for r in features["rubric"] if r.strip()]
+            sentences = self._sentences(features["student_answer"])
+            spans.append((len(texts), len(rubric), len(sentences)))
+            texts.extend(rubric + sentences)
+
+        embeddings = np.asarray(
+            self.encoder.encode(texts, convert_to_numpy=True, normalize_embeddings=True),
+            dtype=np.float32,
+        )
+
+        results = []
+        for features, (start, n_rubric, n_sentences) in zip(inputs, spans):
+            if n_rubric == 0:
+                results.append(({}, 0.0))
+                continue
+
+            rubric_emb = embeddings[start:start + n_rubric]
+            sentence_emb = embeddings[start + n_rubric:start + n_rubric + n_sentences]
+            coverage = (rubric_emb @ sentence_emb.T).max(axis=1)
+
+            met = coverage >= self.high
+            missed = coverage <= self.low
+            confidence = float(np.mean(met | missed))
+
+            results.append((self._grade(features, met), confidence))
+
+        return results
+
+    def _grade(self, features: dict, met: np.ndarray) -> dict:
+        rubric = [r for r in features["rubric"] if r.strip()]
+        covered = [r for r, m in zip(rubric, met) if m]
+        missing = [r for r, m in zip(rubric, met) if not m]
+
+        return {
+            "score": int(round(float(features["max_marks"]) * len(covered) / len(rubric))),
+            "strengths": [f"Covers: {r}" for r in covered],
+            "weakness": [f"Missing: {r}" for r in missing],
+            "justification": f"The answer covers {len(covered)} of {len(rubric)} rubric points.",
+            "suggested_improvement": (
+                "Address: " + "; ".join(missing) if missing
+                else "Add more depth and examples to the answer."
+            ),
+        }
+
+
+class SmallModelScorer:
+    """
+    Grades with a small LLM. Confidence is 0 when its JSON fails validation,
+    otherwise it grows towards clearly wrong (0) or clearly right (max) scores.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def score_batch(self, inputs: List[dict]) -> List[Tuple[dict, float]]:
+        outputs = self.engine.model_evaluator_batch(inputs)
+
+        results = []
+        for features, result in zip(inputs, outputs):
+            max_marks = float(features["max_marks"])
+
+            if (
+                not isinstance(result, dict)
+                or any(k not in result for k in REQUIRED_KEYS)
+                or not isinstance(result["score"], (int, float))
+                or not 0 <= result["score"] <= max_marks
+            ):
+                results.append(({}, 0.0))
+                continue
+
+            results.append((result, abs(2 * result["score"] / max_marks - 1)))
+
+        return results
+
+
+class CascadeEvaluator:
+    def __init__(self, small_tier, large_engine, confidence_threshold: float = 0.8):
+        self.small_tier = small_tier
+        self.large_engine = large_engine
+        self.confidence_threshold = confidence_threshold
+
+        self._lock = threading.Lock()
+        self._tiers = {
+            "small": {"answers": 0, "total_ms": 0.0},
+            "large": {"answers": 0, "total_ms": 0.0},
+        }
+        self._answers = 0
+        self._escalated = 0
+
+    def _record(self, tier: str, answers: int, elapsed_ms: float):
+        with self._lock:
+            self._tiers[tier]["answers"] += answers
+            self._tiers[tier]["total_ms"] += elapsed_ms
+
+    def evaluate(self, input_features: dict) -> dict:
+        return self.evaluate_batch([input_features])[0]
+
+    def evaluate_batch(self, inputs: List[dict]) -> List[dict]:
+        start = time.perf_counter()
+        try:
+            small = self.small_tier.score_batch(inputs)
+        except Exception as e:
+            print("Cascade small tier error:", e)
+            small = [({}, 0.0) for _ in inputs]
+        self._record("small", len(inputs), (time.perf_counter() - start) * 1000)
+
+        results = [{} for _ in inputs]
+        escalate = []
+        for i, (result, confidence) in enumerate(small):
+            if result and confidence >= self.confidence_threshold:
+                result["grading_tier"] = "small"
+                results[i] = result
+            else:
+                escalate.append(i)
+
+        if escalate:
+            start = time.perf_counter()
+            large = self.large_engine.model_evaluator_batch([inputs[i] for i in escalate])
+            self._record("large", len(escalate), (time.perf_counter() - start) * 1000)
+
+            for i, result in zip(escalate, large):
+                if result:
+                    result["grading_tier"] = "large"
+                results[i] = result
+
+        with self._lock:
+            self._answers += len(inputs)
+            self._escalated += len(escalate)
+
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "answers": self._answers,
+                "escalated": self._escalated,
+                "escalation_rate": round(self._escalated / self._answers, 4) if self._answers else 0.0,
+                "tiers": {
+                    tier: {
+                        "answers": data["answers"],
+                        "avg_ms_per_answer": round(data["total_ms"] / data["answers"], 2) if data["answers"] else 0.0,
+                    }
+                    for tier, data in self._tiers.items()
+                },
+            }
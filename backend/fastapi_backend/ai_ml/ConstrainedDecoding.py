@@ -0,0 +1,54 @@
+"""
+Schema-constrained JSON decoding for the transformers LLM backend.
+
+A pydantic schema is turned into a `prefix_allowed_tokens_fn` (via
+lm-format-enforcer) that only lets the model emit tokens which keep the
+output a valid JSON document for that schema.
+
+Engines request it by binding the schema as a generation option:
+
+USAGE :
+--------------------------------
+from ai_ml.ConstrainedDecoding import schema_option
+llm = model.bind(pipeline_kwargs=schema_option(EvalSchema))
+chain = prompt | llm
+
+The MicroBatchScheduler expands the `json_schema` option into a fresh
+`prefix_allowed_tokens_fn` for every generate call (one enforcer per batch,
+tokenizer data computed once).
+"""
+
+import json
+
+try:
+    from lmformatenforcer import JsonSchemaParser
+    from lmformatenforcer.integrations.transformers import (
+        build_token_enforcer_tokenizer_data,
+        build_transformers_prefix_allowed_tokens_fn,
+    )
+except Exception:
+    JsonSchemaParser = None
+
+
+JSON_SCHEMA_OPTION = "json_schema"
+
+
+def schema_option(schema_model) -> dict:
+    """
+    Generation option for a pydantic model. The schema is serialized so that
+    prompts constrained by the same schema can still share a batch.
+    """
+    return {JSON_SCHEMA_OPTION: json.dumps(schema_model.model_json_schema(), sort_keys=True)}
+
+
+class JsonSchemaConstraint:
+    def __init__(self, tokenizer):
+        if JsonSchemaParser is None:
+            raise ImportError(
+                "lm-format-enforcer is required for constrained JSON decoding"
+            )
+        self._tokenizer_data = build_token_enforcer_tokenizer_data(tokenizer)
+
+    def prefix_allowed_tokens_fn(self, schema_json: str):
+        parser = JsonSchemaParser(json.loads(schema_json))
+        return build_transformers_prefix_allowed_tokens_fn(self._tokenizer_data, parser)
@@ -3,9 +3,22 @@ from langchain_core.output_parsers import JsonOutputParser
 
 from pydantic import BaseModel, Field
 from typing import List, Annotated
-import re
 
 from ai_ml.ModelCreator import HFModelCreation
+from ai_ml.BatchScheduler import BatchedLLM
+from ai_ml.ConstrainedDecoding import schema_option
+from ai_ml.GenerationControl import STOP_AT_JSON_END_OPTION, token_budget
+from ai_ml.PrefixCache import PROMPT_PREFIX_OPTION, static_prefix
+from ai_ml.OutputParsing import parse_model_output, parse_model_items
+
+# Bump whenever the template or generation settings change (invalidates cached grades)
+PROMPT_VERSION = "v3"
+
+# Inputs that decide the grade (question_id is only echoed back)
+CACHE_FIELDS = ("rubric", "question_text", "student_answer", "max_marks")
+
+# Rough prompt size estimate used when packing answers into one prompt
+APPROX_CHARS_PER_TOKEN = 4
 
 class EvalSchema(BaseModel):
     score: Annotated[int, Field(title="Score of student")]
@@ -15,29 +28,92 @@ class EvalSchema(BaseModel):
     suggested_improvement: Annotated[str, Field(title="Improvements required")]
 
 
+class PackedEvalItem(EvalSchema):
+    item: Annotated[int, Field(title="Number of the graded item")]
+
+
+class PackedEvalSchema(BaseModel):
+    results: Annotated[List[PackedEvalItem], Field(title="One evaluation per item, in item order")]
+
+
 
 class EvaluationEngine():
 
-    def __init__(self, model_name: str, global_model = None):
+    def __init__(self, model_name: str, global_model = None, cache = None, constrained: bool = False,
+                 max_new_tokens: int = 600, pack_max_items: int = 8, pack_max_prompt_tokens: int = 2048):
         self.model_name = model_name
         self.model = global_model
+        self.cache = cache
+
+        # constrained decoding can only emit JSON matching EvalSchema
+        self.constrained = constrained
+        self.prompt_version = PROMPT_VERSION + ("-json" if constrained else "")
+        self.parse_stats = {"parsed": 0, "failed": 0, "packed_items": 0, "packed_fallbacks": 0}
+
+        # upper bound for the per-request token budget
+        self.max_new_tokens = max_new_tokens
+
+        # packed mode: several answers per prompt, bounded by items and prompt size
+        self.pack_max_items = max(1, pack_max_items)
+        self.pack_max_prompt_tokens = pack_max_prompt_tokens
+
+        # prompt and parser are built once; one chain per token budget (budgets
+        # are rounded to multiples of 32) is reused for every request
+        self._prompt = None
+        self._prefix = None
+        self._parser = None
+        self._chains = {}
+        self._packed_prompt = None
+        self._packed_prefix = None
 
     def get_model(self):
         if self.model is None:
-            self.model = HFModelCreation.hf_model_creator(self.model_name)
+            # standalone use: the scheduler applies the generation options
+            model = HFModelCreation.hf_model_creator(self.model_name, max_new_tokens=self.max_new_tokens)
+            self.model = BatchedLLM.from_llm(model, max_batch_size=1) if model is not None else None
         return self.model
 
-    def sanitize_json(self, text: str) -> str:
-        text = text.replace("```json", "").replace("```", "").strip()
-        match = re.search(r"\{[\s\S]*\}", text)
-        if match:
-            text = match.group(0)
-        text = re.sub(r",\s*}", "}", text)
-        text = re.sub(r",\s*]", "]", text)
-        return text
+    def _token_budget(self, input_features: dict) -> int:
+        """
+        Score and justification plus a strength or weakness line per rubric point,
+        answers to questions worth more marks get longer feedback.
+        """
+        rubric = input_features.get("rubric") or []
+        max_marks = min(float(input_features.get("max_marks") or 0), 20)
+        return token_budget(160 + 32 * len(rubric) + 8 * max_marks, self.max_new_tokens)
+
+    def _bind_options(self, max_new_tokens: int = None, packed: bool = False):
+        options = {STOP_AT_JSON_END_OPTION: True}
+        prefix = self._packed_prefix if packed else self._prefix
+        if prefix:
+            options[PROMPT_PREFIX_OPTION] = prefix
+        if max_new_tokens is not None:
+            options["max_new_tokens"] = max_new_tokens
+        if self.constrained:
+            options.update(schema_option(PackedEvalSchema if packed else EvalSchema))
+        return self.get_model().bind(pipeline_kwargs=options)
+
+    def _budgeted_chain(self, max_new_tokens: int = None, packed: bool = False):
+        """
+        The engine's chain with `max_new_tokens` sized for the request.
+        """
+        key = (max_new_tokens, packed)
+        chain = self._chains.get(key)
+        if chain is None:
+            if packed:
+                prompt = self.create_packed_chain()
+            else:
+                self.create_evaluation_chain()
+                prompt = self._prompt
+            chain = self._chains[key] = prompt | self._bind_options(max_new_tokens, packed=packed)
+        return chain
 
     def create_evaluation_chain(self):
+        if (None, False) in self._chains:
+            return self._chains[(None, False)], self._parser
+
         try:
+            # only for the format instructions; ai_ml.OutputParsing parses the output
             parser = JsonOutputParser(pydantic_object=EvalSchema)
 
             template = """
@@ -46,6 +122,8 @@ Return ONLY valid JSON. If JSON is malformed, fix it and return valid JSON.
 If the student says that they do not know the answer then you must give them a 0
 DO NOT GIVE marks greater than 0 if the student doesn't know the answer
 
+{format_instructions}
+
 Rubric:
 {rubric}
 
@@ -56,8 +134,6 @@ Student Answer:
 {student_answer}
 
 Maximum Marks: {max_marks}
-
-{format_instructions}
 """
 
             prompt = PromptTemplate(
@@ -66,38 +142,246 @@ Maximum Marks: {max_marks}
                 partial_variables={"format_instructions": parser.get_format_instructions()},
             )
 
-            chain = prompt | self.get_model()
+            # static head first, so its KV cache is shared by every request
+            self._prompt, self._prefix = prompt, static_prefix(prompt)
+            chain = self._chains[(None, False)] = prompt | self._bind_options()
+
+            self._parser = parser
             return chain, parser
 
         except Exception as e:
             print("Error creating evaluation chain:", e)
             return None, None
 
+    def create_packed_chain(self):
+        """
+        Prompt grading several (question, rubric, answer) items at once; the
+        instructions and format instructions are paid for once per pack.
+        """
+        if self._packed_prompt is not None:
+            return self._packed_prompt
+
+        parser = JsonOutputParser(pydantic_object=PackedEvalSchema)
+
+        template = """
+You are a very strict exam evaluation engine.
+Grade every item below on its own, against its own rubric and maximum marks.
+Return ONLY valid JSON with one entry in "results" per item, in item order, each with its item number.
+If the student says that they do not know the answer then you must give them a 0
+DO NOT GIVE marks greater than 0 if the student doesn't know the answer
+
+{format_instructions}
+
+{items}
+"""
+
+        prompt = PromptTemplate(
+            template=template,
+            input_variables=["items"],
+            partial_variables={"format_instructions": parser.get_format_instructions()},
+        )
+
+        self._packed_prompt, self._packed_prefix = prompt, static_prefix(prompt)
+        return prompt
+
+    def _format_item(self, number: int, input_features: dict) -> str:
+        return (
+            f"Item {number}:\n"
+            f"Rubric:\n{input_features.get('rubric')}\n\n"
+            f"Question:\n{input_features.get('question_text')}\n\n"
+            f"Student Answer:\n{input_features.get('student_answer')}\n\n"
+            f"Maximum Marks: {input_features.get('max_marks')}\n"
+        )
+
+    def _pack(self, inputs: List[dict], pending: List[int]) -> List[List[int]]:
+        """
+        Consecutive groups of `pending` that fit `pack_max_items`, the prompt
+        size limit and, for the grades they produce, the token budget cap.
+        """
+        groups, group = [], []
+        prompt_tokens = output_tokens = 0
+
+        for i in pending:
+            item_prompt = len(self._format_item(len(group) + 1, inputs[i])) // APPROX_CHARS_PER_TOKEN
+            item_output = self._token_budget(inputs[i])
+
+            if group and (
+                len(group) >= self.pack_max_items
+                or prompt_tokens + item_prompt > self.pack_max_prompt_tokens
+                or output_tokens + item_output > self.max_new_tokens
+            ):
+                groups.append(group)
+                group, prompt_tokens, output_tokens = [], 0, 0
+
+            group.append(i)
+            prompt_tokens += item_prompt
+            output_tokens += item_output
+
+        if group:
+            groups.append(group)
+        return groups
+
+    def _split_packed(self, raw, count: int) -> List[dict]:
+        """
+        Grades of a packed prompt by item number, None for the items that are
+        missing or invalid (output cut off mid-item keeps the items before it).
+        """
+        grades = [None] * count
+        try:
+            if isinstance(raw, Exception):
+                raise raw
+            items = parse_model_items(raw, PackedEvalItem, "results")
+        except Exception as e:
+            print("Packed Evaluation Error:", e)
+            items = []
+
+        for item in items:
+            if item is None:
+                continue
+            number = item.pop("item")
+            if 1 <= number <= count and grades[number - 1] is None:
+                grades[number - 1] = item
+
+        valid = sum(grade is not None for grade in grades)
+        self.parse_stats["packed_items"] += valid
+        self.parse_stats["packed_fallbacks"] += count - valid
+        return grades
+
+    def _parse(self, raw) -> dict:
+        try:
+            parsed = parse_model_output(raw, EvalSchema)
+        except Exception:
+            self.parse_stats["failed"] += 1
+            raise
+        self.parse_stats["parsed"] += 1
+        return parsed
+
+    def _cache_key(self, input_features: dict, packed: bool = False):
+        if self.cache is None:
+            return None
+        inputs = {k: input_features.get(k) for k in CACHE_FIELDS}
+        # a grade from a packed prompt is not the grade of the single-answer prompt
+        prompt_version = self.prompt_version + ("-packed" if packed else "")
+        return self.cache.make_key("evaluation", self.model_name, prompt_version, inputs)
+
     def model_evaluator(self, input_features: dict):
         try:
 
-            chain, parser = self.create_evaluation_chain()
+            key = self._cache_key(input_features)
+            if key is not None:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return cached
+
+            chain = self._budgeted_chain(self._token_budget(input_features))
             raw = chain.invoke(input_features)
 
-            # Extract actual text reliably
-            if isinstance(raw, dict) and "text" in raw:
-                output = raw["text"]
+            result = self._parse(raw)
 
-            elif isinstance(raw, dict) and "generated_text" in raw:
-                output = raw["generated_text"]
+            if key is not None and result:
+                self.cache.set(key, result)
 
-            elif hasattr(raw, "generations"):
-                output = raw.generations[0][0].text
+            return result
 
-            elif isinstance(raw, list) and isinstance(raw[0], dict) and "generated_text" in raw[0]:
-                output = raw[0]["generated_text"]
+        except Exception as e:
+            print("Evaluation Error:", e)
+            return {}
 
+    def model_evaluator_batch(self, inputs: List[dict]) -> List[dict]:
+        """
+        Grade many answers in one pass over the LLM.
+        Returns one entry per input, {} for the items that failed.
+        """
+        results = [{} for _ in inputs]
+        keys = [self._cache_key(features) for features in inputs]
+
+        # only answers missing from the cache go to the LLM
+        pending = []
+        for i, key in enumerate(keys):
+            cached = self.cache.get(key) if key is not None else None
+            if cached is not None:
+                results[i] = cached
             else:
-                output = str(raw)
+                pending.append(i)
 
-            cleaned = self.sanitize_json(output)
-            return parser.parse(cleaned)
+        if not pending:
+            return results
 
+        try:
+            # one budget for the whole batch, rows still stop at their own JSON end
+            chain = self._budgeted_chain(max(self._token_budget(inputs[i]) for i in pending))
+            raws = chain.batch([inputs[i] for i in pending], return_exceptions=True)
         except Exception as e:
-            print("Evaluation Error:", e)
-            return {}
+            print("Batch Evaluation Error:", e)
+            return results
+
+        for i, raw in zip(pending, raws):
+            try:
+                if isinstance(raw, Exception):
+                    raise raw
+                results[i] = self._parse(raw)
+            except Exception as e:
+                print("Evaluation Error:", e)
+                continue
+
+            if keys[i] is not None and results[i]:
+                self.cache.set(keys[i], results[i])
+
+        return results
+
+    def model_evaluator_packed(self, inputs: List[dict]) -> List[dict]:
+        """
+        Grade many answers with several answers per prompt. Items a pack does
+        not grade validly are graded again one per prompt.
+        Returns one entry per input, {} for the items that failed.
+        """
+        results = [{} for _ in inputs]
+        keys = [self._cache_key(features, packed=True) for features in inputs]
+
+        # grades from either prompt are reused
+        pending = []
+        for i, features in enumerate(inputs):
+            single_key = self._cache_key(features)
+            cached = self.cache.get(single_key) if single_key is not None else None
+            if cached is None and keys[i] is not None:
+                cached = self.cache.get(keys[i])
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.append(i)
+
+        groups = self._pack(inputs, pending)
+        packs = [group for group in groups if len(group) > 1]
+        retry = [group[0] for group in groups if len(group) == 1]
+
+        if packs:
+            try:
+                budget = max(sum(self._token_budget(inputs[i]) for i in group) for group in packs)
+                chain = self._budgeted_chain(token_budget(budget, self.max_new_tokens), packed=True)
+                raws = chain.batch(
+                    [
+                        {"items": "\n".join(self._format_item(n, inputs[i]) for n, i in enumerate(group, 1))}
+                        for group in packs
+                    ],
+                    return_exceptions=True
+                )
+            except Exception as e:
+                print("Packed Evaluation Error:", e)
+                raws = [e] * len(packs)
+
+            for group, raw in zip(packs, raws):
+                for i, grade in zip(group, self._split_packed(raw, len(group))):
+                    if grade is None:
+                        retry.append(i)
+                        continue
+
+                    results[i] = grade
+                    if keys[i] is not None:
+                        self.cache.set(keys[i], grade)
+
+        if retry:
+            retry.sort()
+            for i, grade in zip(retry, self.model_evaluator_batch([inputs[i] for i in retry])):
+                results[i] = grade
+
+        return results
@@ -0,0 +1,113 @@
+"""
+Per-request generation limits for the JSON producing engines.
+
+- token_budget            : rounds a task estimate of the output length up
+                            and caps it, used as `max_new_tokens`
+- JsonObjectEndCriteria   : stops a sequence as soon as the first top-level
+                            JSON object it generates is balanced
+
+Engines request the early stop with the `stop_at_json_end` generation option,
+the MicroBatchScheduler turns it into a fresh criteria instance per generate
+call:
+
+USAGE :
+--------------------------------
+from ai_ml.GenerationControl import STOP_AT_JSON_END_OPTION, token_budget
+options = {"max_new_tokens": token_budget(180, cap=600), STOP_AT_JSON_END_OPTION: True}
+chain = prompt | llm.bind(pipeline_kwargs=options)
+"""
+
+try:
+    import torch
+    from transformers import StoppingCriteria
+except Exception:
+    torch = None
+    StoppingCriteria = object
+
+
+STOP_AT_JSON_END_OPTION = "stop_at_json_end"
+
+# budgets are rounded up to this step so similar requests still share a batch
+BUDGET_STEP = 32
+
+
+def token_budget(estimate: int, cap: int) -> int:
+    """
+    `max_new_tokens` for an estimated output length, never above `cap`.
+    """
+    rounded = -(-max(1, int(estimate)) // BUDGET_STEP) * BUDGET_STEP
+    return max(1, min(cap, rounded))
+
+
+class JsonEndScanner:
+    """
+    Tracks brace depth outside of JSON strings for one generated sequence.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escape = False
+        self.done = False
+
+    def feed(self, text: str) -> bool:
+        for c in text:
+            if self.done:
+                break
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+
+            elif c == "{":
+                self.depth += 1
+                self.started = True
+
+            elif not self.started:
+                # prose or a ```json fence before the object
+                continue
+
+            elif c == '"':
+                self.in_string = True
+
+            elif c == "}":
+                self.depth -= 1
+                self.done = self.depth == 0
+
+        return self.done
+
+
+class JsonObjectEndCriteria(StoppingCriteria):
+    """
+    State is kept per batch row, so use one instance per generate call.
+    """
+
+    def __init__(self, tokenizer, prompt_length: int = None):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self._scanners = None
+        self._positions = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        batch_size, length = input_ids.shape
+
+        if self._scanners is None:
+            # without a known prompt length, the first call follows the first token
+            start = self.prompt_length if self.prompt_length is not None else length - 1
+            self._scanners = [JsonEndScanner() for _ in range(batch_size)]
+            self._positions = [start] * batch_size
+
+        done = []
+        for row, scanner in enumerate(self._scanners):
+            if not scanner.done:
+                new_ids = input_ids[row, self._positions[row]:]
+                scanner.feed(self.tokenizer.decode(new_ids, skip_special_tokens=True))
+                self._positions[row] = length
+            done.append(scanner.done)
+
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
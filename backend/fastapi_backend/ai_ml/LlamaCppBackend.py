@@ -0,0 +1,78 @@
+"""
+llama.cpp (GGUF) backend for the evaluation LLM.
+
+Runs a quantized GGUF model with llama-cpp-python, much lighter and faster
+than the transformers path on CPU-only nodes. It is a LangChain LLM, so the
+engines use it exactly like the HuggingFacePipeline.
+
+The MicroBatchScheduler calls `generate_with_options` so the generation
+options the engines bind are applied here as well:
+    - max_new_tokens   -> max_tokens
+    - do_sample        -> temperature (greedy unless set)
+    - json_schema      -> GBNF grammar compiled from the schema
+    - stop_at_json_end -> stream and stop once the JSON object is balanced
+A `cancelled` callable stops the stream as soon as it returns True.
+
+llama.cpp keeps the KV cache of the previous prompt and only evaluates the
+tokens after the longest common prefix, so the static prompt head is reused
+without the transformers PrefixKVCache.
+
+USAGE :
+--------------------------------
+from ai_ml.LlamaCppBackend import GGUFLlamaCpp
+llm = GGUFLlamaCpp(model_path="models/phi-3.5-mini-instruct-q4_k_m.gguf", n_ctx=4096)
+text = llm.generate_with_options(prompt, {"max_new_tokens": 256, "stop_at_json_end": True})
+"""
+
+from typing import Any, Dict
+
+from langchain_community.llms import LlamaCpp
+from pydantic import PrivateAttr
+
+from ai_ml.ConstrainedDecoding import JSON_SCHEMA_OPTION
+from ai_ml.GenerationControl import STOP_AT_JSON_END_OPTION, JsonEndScanner
+
+
+class GGUFLlamaCpp(LlamaCpp):
+
+    # json schema -> compiled LlamaGrammar (private: not part of the LLM's config)
+    _grammars: Dict[str, Any] = PrivateAttr(default_factory=dict)
+
+    def _grammar(self, schema_json: str):
+        if schema_json not in self._grammars:
+            from llama_cpp import LlamaGrammar
+
+            self._grammars[schema_json] = LlamaGrammar.from_json_schema(schema_json, verbose=False)
+        return self._grammars[schema_json]
+
+    def generate_with_options(self, prompt: str, options: Dict[str, Any], cancelled=None) -> str:
+        options = dict(options or {})
+        params = self._get_parameters()
+
+        max_new_tokens = options.pop("max_new_tokens", None)
+        if max_new_tokens is not None:
+            params["max_tokens"] = max_new_tokens
+
+        if options.pop("do_sample", False):
+            params["temperature"] = options.pop("temperature", 0.7)
+
+        schema = options.pop(JSON_SCHEMA_OPTION, None)
+        if schema is not None:
+            params["grammar"] = self._grammar(schema)
+
+        stop_at_json_end = options.pop(STOP_AT_JSON_END_OPTION, False)
+        if not stop_at_json_end and cancelled is None:
+            result = self.client(prompt=prompt, **params)
+            return result["choices"][0]["text"]
+
+        # closing the stream stops llama.cpp right after the closing brace
+        scanner = JsonEndScanner()
+        text = ""
+        for part in self.client(prompt=prompt, stream=True, **params):
+            chunk = part["choices"][0]["text"]
+            text += chunk
+            if stop_at_json_end and scanner.feed(chunk):
+                break
+            if cancelled is not None and cancelled():
+                break
+        return text
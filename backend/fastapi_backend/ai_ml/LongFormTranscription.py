@@ -0,0 +1,101 @@
+"""
+Batched transcription of long answers.
+
+Whisper decodes 30 s windows; `model.transcribe` walks a long answer one
+window after the other, so its latency grows with the answer's duration.
+Here the preprocessed chunks (at most one window each, cut between speech
+segments where possible) are decoded `batch_size` at a time in a single
+forward pass, and the texts are stitched back together. Where two chunks
+had to be cut mid-speech they share `overlap` samples, and the words the
+next chunk repeats at its start are dropped.
+
+USAGE :
+--------------------------------
+from ai_ml.LongFormTranscription import whisper_transcribe_chunks, stitch_transcripts
+texts = whisper_transcribe_chunks(whisper_model, result.chunks, language="en", batch_size=4)
+text = stitch_transcripts(texts, result.chunk_overlaps)
+"""
+
+import re
+from typing import List, Optional
+
+import numpy as np
+
+# Whisper's input window, the longest chunk one decode sees
+WHISPER_WINDOW_SEC = 30
+
+# longest repeated run (words) looked for at an overlapped boundary
+MAX_STITCH_WORDS = 12
+
+_WORD = re.compile(r"\w+")
+
+
+def whisper_transcribe_chunks(
+    model,
+    chunks: List[np.ndarray],
+    language: Optional[str] = None,
+    batch_size: int = 4,
+) -> List[str]:
+    """
+    Text of every chunk (16 kHz float32, at most WHISPER_WINDOW_SEC each),
+    decoding `batch_size` chunks per forward pass.
+    """
+    import torch
+    import whisper
+
+    n_mels = getattr(model.dims, "n_mels", 80)
+    options = whisper.DecodingOptions(
+        language=language,
+        without_timestamps=True,
+        fp16=model.device.type == "cuda",
+    )
+
+    texts = []
+    batch_size = max(1, batch_size)
+    for i in range(0, len(chunks), batch_size):
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(
+                whisper.pad_or_trim(torch.from_numpy(np.ascontiguousarray(chunk, dtype=np.float32))),
+                n_mels=n_mels,
+            )
+            for chunk in chunks[i:i + batch_size]
+        ]).to(model.device)
+
+        results = whisper.decode(model, mels, options)
+        texts.extend(result.text.strip() for result in results)
+
+    return texts
+
+
+def _normalized(words: List[str]) -> List[str]:
+    return ["".join(_WORD.findall(word)).lower() for word in words]
+
+
+def stitch_transcripts(texts: List[str], overlaps: Optional[List[int]] = None) -> str:
+    """
+    Join chunk texts. After an overlapped cut the next text repeats the end of
+    the previous one: its longest word prefix matching the previous suffix
+    (case and punctuation ignored) is dropped.
+    """
+    overlaps = overlaps or []
+    stitched = ""
+
+    for i, text in enumerate(texts):
+        text = text.strip()
+        if not text:
+            continue
+
+        if i > 0 and i - 1 < len(overlaps) and overlaps[i - 1] > 0 and stitched:
+            previous = _normalized(stitched.split()[-MAX_STITCH_WORDS:])
+            words = text.split()
+            current = _normalized(words[:MAX_STITCH_WORDS])
+
+            for n in range(min(len(previous), len(current)), 0, -1):
+                if previous[-n:] == current[:n]:
+                    text = " ".join(words[n:])
+                    break
+
+        if text:
+            stitched = f"{stitched} {text}" if stitched else text
+
+    return stitched
@@ -1,6 +1,12 @@
 from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
 from langchain_huggingface import HuggingFacePipeline
 
+from ai_ml.AssistedDecoding import DraftModel
+from ai_ml.Cancellation import install_cancellation_hook
+from ai_ml.CPUOptimization import load_kwargs, optimize_model, resident_memory_mb
+
+import time
+
 import whisper
 
 from sentence_transformers import SentenceTransformer, util
@@ -11,30 +17,86 @@ except Exception:
     torch = None
 
 class HFModelCreation:
+    # model name -> load mode, time and resident memory
+    load_reports = {}
+
     def __init__(self):
         pass
+
+    @staticmethod
+    def llm_creator(backend: str, model_name: str, max_new_tokens: int = 600,
+                    cpu_optimization: str = "", compile_model: bool = False, **backend_options):
+        """
+        LLM for the given backend ("transformers" or "llama_cpp"), as a
+        LangChain LLM either way. backend_options go to the llama.cpp backend.
+        """
+        if backend == "llama_cpp":
+            return HFModelCreation.llama_cpp_model_creator(max_new_tokens=max_new_tokens, **backend_options)
+        return HFModelCreation.hf_model_creator(
+            model_name,
+            max_new_tokens=max_new_tokens,
+            cpu_optimization=cpu_optimization,
+            compile_model=compile_model
+        )
+
+    @staticmethod
+    def llama_cpp_model_creator(model_path: str, max_new_tokens: int = 600, n_ctx: int = 4096,
+                                n_threads: int = 0, n_batch: int = 512):
+        try:
+            from ai_ml.LlamaCppBackend import GGUFLlamaCpp
+
+            return GGUFLlamaCpp(
+                model_path=model_path,
+                n_ctx=n_ctx,
+                # 0 = let llama.cpp use every physical core
+                n_threads=n_threads or None,
+                n_batch=n_batch,
+                max_tokens=max_new_tokens,
+                temperature=0.0,
+                verbose=False
+            )
+
+        except Exception as e:
+            print("Error loading GGUF model:", e)
+            return None
     
     @staticmethod
-    def hf_model_creator(model_name: str):
+    def hf_model_creator(model_name: str, max_new_tokens: int = 600,
+                         cpu_optimization: str = "", compile_model: bool = False):
         try:
+            rss_before = resident_memory_mb()
+            start = time.perf_counter()
+
             tokenizer = AutoTokenizer.from_pretrained(
                 model_name, trust_remote_code=True
             )
 
-            model = AutoModelForCausalLM.from_pretrained(
-                model_name,
-                torch_dtype="auto",
-                device_map="auto",
-                trust_remote_code=True
-            )
+            kwargs = load_kwargs(cpu_optimization)
+            try:
+                model = AutoModelForCausalLM.from_pretrained(
+                    model_name, trust_remote_code=True, **kwargs
+                )
+            except ValueError as e:
+                if "attn_implementation" not in kwargs:
+                    raise
+                # model code without SDPA support
+                print("SDPA attention unavailable:", e)
+                kwargs.pop("attn_implementation")
+                model = AutoModelForCausalLM.from_pretrained(
+                    model_name, trust_remote_code=True, **kwargs
+                )
+
+            model = optimize_model(model, cpu_optimization, compile_model)
 
             tokenizer.pad_token = tokenizer.eos_token
+            # decoder-only models must be left padded for batched generation
+            tokenizer.padding_side = "left"
 
             gen = pipeline(
                 "text-generation",
                 model=model,
                 tokenizer=tokenizer,
-                max_new_tokens=600,
+                max_new_tokens=max_new_tokens,
                 temperature=0.0,
                 do_sample=False,
                 eos_token_id=tokenizer.eos_token_id,
@@ -42,12 +104,50 @@ class HFModelCreation:
                 return_full_text=False
             )
 
+            rss_after = resident_memory_mb()
+            HFModelCreation.load_reports[model_name] = {
+                "cpu_optimization": cpu_optimization or "none",
+                "attention": kwargs.get("attn_implementation", "default"),
+                "compiled": bool(compile_model and cpu_optimization),
+                "load_seconds": round(time.perf_counter() - start, 2),
+                "rss_mb": rss_after,
+                "model_rss_mb": round(rss_after - rss_before, 1),
+            }
+
             return HuggingFacePipeline(pipeline=gen)
 
         except Exception as e:
             print("Error loading HF model:", e)
             return None
 
+    @staticmethod
+    def hf_draft_model_creator(model_name: str, tokenizer):
+        """
+        Small draft model for assisted generation. It must share the main
+        model's tokenizer, otherwise None is returned.
+        """
+        try:
+            draft_tokenizer = AutoTokenizer.from_pretrained(
+                model_name, trust_remote_code=True
+            )
+            if draft_tokenizer.get_vocab() != tokenizer.get_vocab():
+                print("Draft model ignored: its tokenizer differs from the main model's")
+                return None
+
+            model = AutoModelForCausalLM.from_pretrained(
+                model_name,
+                torch_dtype="auto",
+                device_map="auto",
+                trust_remote_code=True
+            )
+            model.eval()
+
+            return DraftModel(model)
+
+        except Exception as e:
+            print("Error loading draft model:", e)
+            return None
+
 
 class SpeechModelGenerator:
     """
@@ -73,6 +173,8 @@ class SpeechModelGenerator:
 
         if cls._whisper_model is None:
             cls._whisper_model = whisper.load_model("base")
+            # stop decoding within one token once the request is cancelled
+            install_cancellation_hook(cls._whisper_model.encoder, cls._whisper_model.decoder)
         return cls._whisper_model
 
     @classmethod
@@ -86,5 +188,6 @@ class SpeechModelGenerator:
                 model="openai/whisper-large-v3",
                 device=device
             )
+            install_cancellation_hook(cls._hf_model.model)
         return cls._hf_model
 
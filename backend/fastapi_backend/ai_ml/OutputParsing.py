@@ -0,0 +1,320 @@
+"""
+Shared extraction and validation of the JSON object in LLM output.
+
+    - raw_text           : text from any LangChain / pipeline return shape
+    - parse_json_object  : first JSON object in the text; a C-speed raw_decode
+                           first, a one-pass repair on failure (code fences,
+                           missing / trailing commas, unquoted keys, raw
+                           newlines in strings, stray closers, output
+                           truncated anywhere; measured by
+                           `python benchmarks/output_parsing_corpus.py`,
+                           run from backend/fastapi_backend)
+    - parse_model_output : the above plus direct pydantic validation
+    - parse_model_items  : validation of every element of an array field on
+                           its own (packed prompts grading several items)
+
+USAGE :
+--------------------------------
+from ai_ml.OutputParsing import parse_model_output
+result = parse_model_output(chain.invoke(inputs), EvalSchema)     # dict
+"""
+
+import json
+from typing import List, Optional, Tuple
+
+from ai_ml.AIExceptions import OutputParsingException
+
+_decoder = json.JSONDecoder()
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+# what an open container expects next
+_KEY, _COLON, _VALUE, _AFTER_VALUE = "key", "colon", "value", "after_value"
+
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+_HEX = set("0123456789abcdefABCDEF")
+
+_STRING_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+
+def raw_text(raw) -> str:
+    if isinstance(raw, str):
+        return raw
+
+    if isinstance(raw, dict):
+        for key in ("text", "generated_text", "output_text"):
+            if key in raw:
+                return raw[key]
+        return json.dumps(raw)
+
+    if hasattr(raw, "generations"):
+        return raw.generations[0][0].text
+
+    if isinstance(raw, list) and raw and isinstance(raw[0], dict) and "generated_text" in raw[0]:
+        return raw[0]["generated_text"]
+
+    return str(raw)
+
+
+def _drop_trailing_comma(out: list):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def _is_literal_char(c: str) -> bool:
+    return c.isalnum() or c in "+-._"
+
+
+class _Container:
+    __slots__ = ("closer", "state", "member_start")
+
+    def __init__(self, closer: str):
+        self.closer = closer
+        self.state = _KEY if closer == "}" else _VALUE
+        # output position of the current member (its comma included), cut
+        # when the member is left dangling
+        self.member_start = None
+
+    @property
+    def dangling(self) -> bool:
+        # an object key without a value
+        return self.closer == "}" and self.state in (_COLON, _VALUE)
+
+
+def repair_json(text: str, start: int = 0) -> str:
+    """
+    Copy the object starting at `start` up to its balancing brace, fixing
+    what models commonly get wrong on the way: missing commas and colons,
+    unquoted keys, Python literals, stray closers, trailing commas, raw
+    control characters in strings, and output truncated anywhere (a dangling
+    key or a cut-off literal is dropped, open strings and containers closed).
+    """
+    return _repair(text, start)[0]
+
+
+def _repair(text: str, start: int) -> Tuple[str, int]:
+    # also returns how many containers the text left open (0 = not truncated)
+    out = []
+    stack: List[_Container] = []
+    in_string = False
+    string_is_key = False
+    escape = False
+    literal_start = None
+    literal_is_key = False
+
+    def open_member(top: _Container):
+        # comma before a member that follows a complete one
+        if top.state == _AFTER_VALUE:
+            top.member_start = len(out)
+            out.append(",")
+        elif top.member_start is None:
+            top.member_start = len(out)
+
+    def begin_key(top: _Container):
+        open_member(top)
+        top.state = _COLON
+
+    def begin_value():
+        if not stack:
+            return
+        top = stack[-1]
+        if top.closer == "}":
+            if top.state == _COLON:
+                out.append(":")
+            elif top.state in (_KEY, _AFTER_VALUE):
+                # a value where a key belongs, nothing sensible to insert
+                open_member(top)
+        else:
+            open_member(top)
+        top.state = _AFTER_VALUE
+
+    def finish_literal():
+        nonlocal literal_start
+        token = "".join(out[literal_start:])
+        if literal_is_key:
+            out.append('"')
+        elif token in _PYTHON_LITERALS:
+            del out[literal_start:]
+            out.append(_PYTHON_LITERALS[token])
+        literal_start = None
+
+    def close(top: _Container):
+        if top.dangling:
+            del out[top.member_start:]
+        _drop_trailing_comma(out)
+        out.append(top.closer)
+
+    for c in text[start:]:
+        if in_string:
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == '"':
+                in_string = False
+            elif c in _STRING_ESCAPES:
+                c = _STRING_ESCAPES[c]
+            out.append(c)
+            continue
+
+        if literal_start is not None:
+            if _is_literal_char(c):
+                out.append(c)
+                continue
+            finish_literal()
+
+        if c == '"':
+            top = stack[-1] if stack else None
+            string_is_key = top is not None and top.closer == "}" and top.state in (_KEY, _AFTER_VALUE)
+            if string_is_key:
+                begin_key(top)
+            else:
+                begin_value()
+            in_string = True
+            out.append(c)
+
+        elif c in _CLOSERS:
+            begin_value()
+            stack.append(_Container(_CLOSERS[c]))
+            out.append(c)
+
+        elif c in "}]":
+            if not any(top.closer == c for top in stack):
+                # closer that does not match anything open
+                continue
+            # a missing closer is implied by the outer one
+            while stack[-1].closer != c:
+                close(stack.pop())
+            close(stack.pop())
+            if not stack:
+                break
+
+        elif c == ":":
+            if stack and stack[-1].state == _COLON:
+                stack[-1].state = _VALUE
+                out.append(c)
+
+        elif c == ",":
+            if stack and stack[-1].state == _AFTER_VALUE:
+                top = stack[-1]
+                top.member_start = len(out)
+                top.state = _KEY if top.closer == "}" else _VALUE
+                out.append(c)
+
+        elif _is_literal_char(c) and stack:
+            top = stack[-1]
+            literal_is_key = top.closer == "}" and top.state in (_KEY, _AFTER_VALUE)
+            if literal_is_key:
+                # unquoted key
+                begin_key(top)
+                out.append('"')
+            else:
+                begin_value()
+            literal_start = len(out)
+            out.append(c)
+
+        else:
+            out.append(c)
+
+    # truncated output: drop what cannot be completed, close the rest
+    if in_string:
+        if string_is_key:
+            stack[-1].state = _COLON
+        else:
+            if escape:
+                out.pop()
+            # cut-off \uXXXX escape
+            hex_digits = 0
+            while hex_digits < 3 and out and out[-1 - hex_digits] in _HEX:
+                hex_digits += 1
+            if len(out) > hex_digits + 1 and out[-1 - hex_digits] == "u" and out[-2 - hex_digits] == "\\":
+                del out[-2 - hex_digits:]
+            out.append('"')
+
+    elif literal_start is not None:
+        token = "".join(out[literal_start:])
+        if literal_is_key:
+            stack[-1].state = _COLON
+        elif token not in _PYTHON_LITERALS and token not in ("true", "false", "null"):
+            # a number may be cut off (3.5 -> 3) as much as true/false/null: drop the member
+            top = stack[-1]
+            del out[top.member_start:]
+            top.state = _KEY if top.closer == "}" else _VALUE
+        else:
+            literal_is_key = False
+            finish_literal()
+
+    open_at_end = len(stack)
+    while stack:
+        close(stack.pop())
+
+    return "".join(out), open_at_end
+
+
+def parse_json_object(text: str) -> dict:
+    return _parse_object(text)[0]
+
+
+def _parse_object(text: str) -> Tuple[dict, int]:
+    start = text.find("{")
+    if start < 0:
+        raise OutputParsingException("No JSON object in model output")
+
+    open_at_end = 0
+    try:
+        # parses the first value and ignores whatever follows it
+        obj, _ = _decoder.raw_decode(text, start)
+    except ValueError:
+        try:
+            repaired, open_at_end = _repair(text, start)
+            obj = json.loads(repaired)
+        except ValueError as e:
+            raise OutputParsingException(f"Invalid JSON in model output: {e}") from e
+
+    if not isinstance(obj, dict):
+        raise OutputParsingException("Model output is not a JSON object")
+    return obj, open_at_end
+
+
+def parse_model_output(raw, schema, defaults: Optional[dict] = None) -> dict:
+    """
+    Validated dict for `schema`. `defaults` fill fields the model left out
+    (ids and texts the request already knows).
+    """
+    obj = parse_json_object(raw_text(raw))
+
+    if defaults:
+        for key, value in defaults.items():
+            if obj.get(key) in (None, ""):
+                obj[key] = value
+
+    return schema.model_validate(obj).model_dump()
+
+
+def parse_model_items(raw, schema, field: str) -> List[Optional[dict]]:
+    """
+    Validated dict for `schema` per element of the `field` array, None for
+    the elements that fail, so one bad item does not discard the others.
+    Output cut off inside an element keeps the complete elements before it.
+    """
+    obj, open_at_end = _parse_object(raw_text(raw))
+
+    items = obj.get(field)
+    if not isinstance(items, list):
+        raise OutputParsingException(f"Model output has no '{field}' array")
+
+    # more open than the object and its array: the last element was cut off,
+    # even if what is left of it would validate
+    if open_at_end > 2 and items:
+        items = items[:-1]
+
+    parsed = []
+    for item in items:
+        try:
+            parsed.append(schema.model_validate(item).model_dump())
+        except ValueError:
+            parsed.append(None)
+    return parsed
@@ -0,0 +1,114 @@
+"""
+Reuse of the KV cache for the static head of a prompt template.
+
+The instructions and format instructions that open every evaluation, rubric
+and question prompt are encoded once; later prompts starting with the same
+text only prefill their variable suffix (rubric, question, answer, ...).
+
+Engines pass the static head with the `prompt_prefix` generation option and
+the MicroBatchScheduler hands a copy of its past-key-values to `generate`:
+
+USAGE :
+--------------------------------
+from ai_ml.PrefixCache import PrefixKVCache, static_prefix
+prefix = static_prefix(prompt_template)
+cache = PrefixKVCache(hf_pipeline)
+past = cache.past_key_values(prompt_text, prefix)     # None when not usable
+hf_pipeline(prompt_text, past_key_values=past)
+"""
+
+import copy
+import threading
+from collections import OrderedDict
+
+try:
+    import torch
+    from transformers import DynamicCache
+except Exception:
+    torch = None
+    DynamicCache = None
+
+
+PROMPT_PREFIX_OPTION = "prompt_prefix"
+
+_SENTINEL = "\x00"
+
+
+def static_prefix(prompt) -> str:
+    """
+    Text of a PromptTemplate before its first input variable. It is cut at a
+    line break so the prefix tokenizes the same way inside the full prompt.
+    """
+    text = prompt.format(**{name: _SENTINEL for name in prompt.input_variables})
+    head = text.split(_SENTINEL, 1)[0]
+    return head[:head.rfind("\n") + 1]
+
+
+class PrefixKVCache:
+    def __init__(self, hf_pipeline, max_entries: int = 8):
+        if DynamicCache is None:
+            raise ImportError("transformers with DynamicCache support is required for prefix caching")
+
+        self.model = hf_pipeline.model
+        self.tokenizer = hf_pipeline.tokenizer
+        self.max_entries = max_entries
+
+        # prefix text -> (prefix token ids, DynamicCache)
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._mismatches = 0
+        self._computed = 0
+        self._reused_tokens = 0
+
+    def _entry(self, prefix: str):
+        with self._lock:
+            if prefix in self._entries:
+                self._entries.move_to_end(prefix)
+                return self._entries[prefix]
+
+        ids = self.tokenizer(prefix, return_tensors="pt")["input_ids"].to(self.model.device)
+        with torch.no_grad():
+            cache = self.model(input_ids=ids, past_key_values=DynamicCache(), use_cache=True).past_key_values
+
+        entry = (ids[0].tolist(), cache)
+        with self._lock:
+            self._entries[prefix] = entry
+            self._computed += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def past_key_values(self, prompt: str, prefix: str):
+        """
+        Copy of the cached KV for `prefix`, or None when the tokens of
+        `prompt` do not start with the tokens of `prefix`.
+        """
+        if not prefix or not prompt.startswith(prefix):
+            return None
+
+        prefix_ids, cache = self._entry(prefix)
+        prompt_ids = self.tokenizer(prompt)["input_ids"]
+
+        if len(prompt_ids) <= len(prefix_ids) or prompt_ids[:len(prefix_ids)] != prefix_ids:
+            with self._lock:
+                self._mismatches += 1
+            return None
+
+        with self._lock:
+            self._hits += 1
+            self._reused_tokens += len(prefix_ids)
+
+        # generate extends the cache in place, every call gets its own copy
+        return copy.deepcopy(cache)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "prefixes": len(self._entries),
+                "computed": self._computed,
+                "hits": self._hits,
+                "mismatches": self._mismatches,
+                "reused_tokens": self._reused_tokens,
+            }
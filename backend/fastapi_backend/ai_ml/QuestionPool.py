@@ -0,0 +1,167 @@
+"""
+Per-topic pool of generated questions with embedding-based deduplication.
+
+Every question generated for a (subject, topic) pair is kept in SQLite, so a
+follow-up request only generates the questions the pool is missing. New
+questions are embedded with the sentence-transformer used for MCQ evaluation
+and dropped when their cosine similarity to a pooled question (or to an
+earlier question of the same batch) reaches `threshold`.
+
+Embeddings stay in memory: a topic is encoded in one call the first time it
+is used after a restart, and at most `max_topics` topics are kept (least
+recently used dropped first, their questions stay in SQLite).
+
+USAGE :
+--------------------------------
+from ai_ml.QuestionPool import QuestionPool
+pool = QuestionPool("cache/question_pool.sqlite3", sentence_transformer, threshold=0.9)
+key = pool.topic_key(subject, topic)
+questions = pool.questions(key)
+added = pool.add(key, generated_questions)      # the ones that were not duplicates
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+
+
+class QuestionPool:
+    def __init__(
+        self,
+        path: str,
+        encoder,
+        threshold: float = 0.9,
+        max_questions_per_topic: int = 500,
+        max_topics: int = 1000,
+    ):
+        self.path = path
+        self.encoder = encoder
+        self.threshold = threshold
+        self.max_questions_per_topic = max(1, max_questions_per_topic)
+        self.max_topics = max(1, max_topics)
+
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS questions (
+                topic_key TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                question TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (topic_key, position)
+            )
+            """
+        )
+        self._conn.commit()
+
+        # topic key -> (questions, normalized embeddings)
+        self._topics: "OrderedDict[str, tuple]" = OrderedDict()
+
+        self._added = 0
+        self._duplicates = 0
+
+    @staticmethod
+    def topic_key(subject: str, topic: str) -> str:
+        payload = json.dumps(
+            [" ".join(subject.lower().split()), " ".join(topic.lower().split())],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        embeddings = self.encoder.encode(
+            texts, convert_to_numpy=True, normalize_embeddings=True
+        )
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def _load(self, topic_key: str):
+        # caller holds the lock
+        entry = self._topics.get(topic_key)
+        if entry is None:
+            rows = self._conn.execute(
+                "SELECT question FROM questions WHERE topic_key = ? ORDER BY position",
+                (topic_key,)
+            ).fetchall()
+            questions = [row[0] for row in rows]
+            embeddings = self.embed(questions) if questions else None
+            entry = (questions, embeddings)
+
+            self._topics[topic_key] = entry
+            if len(self._topics) > self.max_topics:
+                self._topics.popitem(last=False)
+
+        self._topics.move_to_end(topic_key)
+        return entry
+
+    def questions(self, topic_key: str) -> List[str]:
+        with self._lock:
+            return list(self._load(topic_key)[0])
+
+    def add(self, topic_key: str, candidates: List[str]) -> List[str]:
+        """
+        Add the candidates that are not near-duplicates of pooled questions
+        or of each other. Returns the added questions, in order.
+        """
+        candidates = [c.strip() for c in candidates if c and c.strip()]
+        if not candidates:
+            return []
+
+        embeddings = self.embed(candidates)
+
+        with self._lock:
+            questions, pooled = self._load(topic_key)
+            room = self.max_questions_per_topic - len(questions)
+
+            added, kept = [], []
+            for question, embedding in zip(candidates, embeddings):
+                seen = [e for e in (pooled, np.array(kept) if kept else None) if e is not None]
+                if any(float(np.max(e @ embedding)) >= self.threshold for e in seen):
+                    self._duplicates += 1
+                    continue
+                added.append(question)
+                kept.append(embedding)
+
+            # a full pool still returns the new questions, it just stops growing
+            stored = added[:max(room, 0)]
+            if stored:
+                now = time.time()
+                self._conn.executemany(
+                    "INSERT INTO questions (topic_key, position, question, created_at) VALUES (?, ?, ?, ?)",
+                    [(topic_key, len(questions) + i, q, now) for i, q in enumerate(stored)]
+                )
+                self._conn.commit()
+
+                new = np.array(kept[:len(stored)], dtype=np.float32)
+                self._topics[topic_key] = (
+                    questions + stored,
+                    new if pooled is None else np.vstack([pooled, new])
+                )
+
+            self._added += len(added)
+
+        return added
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "topics": self._conn.execute(
+                    "SELECT COUNT(DISTINCT topic_key) FROM questions"
+                ).fetchone()[0],
+                "questions": self._conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0],
+                "loaded_topics": len(self._topics),
+                "added": self._added,
+                "duplicates_dropped": self._duplicates,
+            }
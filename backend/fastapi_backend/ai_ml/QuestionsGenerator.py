@@ -3,11 +3,25 @@ from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
 
 from pydantic import BaseModel, Field
 from typing import List, Dict, Annotated, Optional
-import re
 
 from ai_ml.ModelCreator import HFModelCreation
+from ai_ml.BatchScheduler import BatchedLLM
+from ai_ml.ConstrainedDecoding import schema_option
+from ai_ml.GenerationControl import STOP_AT_JSON_END_OPTION, token_budget
+from ai_ml.PrefixCache import PROMPT_PREFIX_OPTION, static_prefix
+from ai_ml.StreamingJson import JsonArrayItemStream
+from ai_ml.OutputParsing import parse_model_output
 from ai_ml.AIExceptions import *
 
+# Bump whenever the template or generation settings change (invalidates cached questions)
+PROMPT_VERSION = "v4"
+
+# Inputs that decide the questions (topic_id is only echoed back)
+CACHE_FIELDS = ("topic", "subject", "num_questions", "existing_questions")
+
+# Questions already asked on the topic that are shown to the model ("generate more")
+MAX_EXISTING_QUESTIONS = 30
+
 
 class OutputResponse(BaseModel):
     topic_id: Annotated[str, Field(title="Topic id", description="The topic id from database", min_length=1)]
@@ -15,17 +29,68 @@ class OutputResponse(BaseModel):
     questions: Annotated[List[str], Field(title="Questions", description="The questions created by the model")]
 
 class QuestionsGenerator:
-    def __init__(self, model_name: str, global_model = None):
+    def __init__(self, model_name: str, global_model = None, cache = None, constrained: bool = False,
+                 max_new_tokens: int = 600):
         self.model_name = model_name
         self.model = global_model
+        self.cache = cache
+
+        # constrained decoding can only emit JSON matching OutputResponse
+        self.constrained = constrained
+        self.prompt_version = PROMPT_VERSION + ("-json" if constrained else "")
+        self.parse_stats = {"parsed": 0, "failed": 0}
+
+        # upper bound for the per-request token budget
+        self.max_new_tokens = max_new_tokens
+
+        # prompt and parser are built once; one chain per token budget (budgets
+        # are rounded to multiples of 32) is reused for every request
+        self._prompt = None
+        self._prefix = None
+        self._parser = None
+        self._chains = {}
 
     def get_model(self):
         if self.model is None:
-            self.model = HFModelCreation.hf_model_creator(self.model_name)
+            # standalone use: the scheduler applies the generation options
+            model = HFModelCreation.hf_model_creator(self.model_name, max_new_tokens=self.max_new_tokens)
+            self.model = BatchedLLM.from_llm(model, max_batch_size=1) if model is not None else None
         return self.model
 
+    def _token_budget(self, input_request: dict) -> int:
+        """
+        The topic is echoed back, then one short question per requested question.
+        """
+        topic = str(input_request.get("topic", ""))
+        num_questions = int(input_request.get("num_questions") or 0)
+        return token_budget(64 + len(topic) // 3 + 48 * num_questions, self.max_new_tokens)
+
+    def _bind_options(self, max_new_tokens: int = None):
+        options = {STOP_AT_JSON_END_OPTION: True}
+        if self._prefix:
+            options[PROMPT_PREFIX_OPTION] = self._prefix
+        if max_new_tokens is not None:
+            options["max_new_tokens"] = max_new_tokens
+        if self.constrained:
+            options.update(schema_option(OutputResponse))
+        return self.get_model().bind(pipeline_kwargs=options)
+
+    def _budgeted_chain(self, max_new_tokens: int):
+        """
+        The engine's chain with `max_new_tokens` sized for the request.
+        """
+        chain = self._chains.get(max_new_tokens)
+        if chain is None:
+            self.chain_creator()
+            chain = self._chains[max_new_tokens] = self._prompt | self._bind_options(max_new_tokens)
+        return chain
+
     
     def chain_creator(self):
+        if None in self._chains:
+            return self._chains[None], self._parser
+
+        # only for the format instructions; ai_ml.OutputParsing parses the output
         parser = JsonOutputParser(pydantic_object=OutputResponse)
 
         template = """
@@ -35,39 +100,35 @@ You have to generate some number of questions on the given topic from the subjec
 Be sure that the questions are well stuctured and to the context of the topic and must fall within the subject as requested
 Return ONLY valid JSON. If JSON is malformed, fix it and return valid JSON
 
+{format_instructions}
+
 Number of questions: {num_questions},
 
 Topic: {topic}
 
 Suject: {subject}
 
-{format_instructions}
+Questions already asked on this topic, do not repeat them:
+{existing_questions}
 """
 
         prompt = PromptTemplate(
             template=template,
-            input_variables= ["num_questions", "topic", "subject"],
+            input_variables= ["num_questions", "topic", "subject", "existing_questions"],
             partial_variables= {
                 "format_instructions": parser.get_format_instructions()
             }
         )
 
 
-        chain = prompt | self.get_model()
+        # static head first, so its KV cache is shared by every request
+        self._prompt, self._prefix = prompt, static_prefix(prompt)
+        chain = self._chains[None] = prompt | self._bind_options()
 
+        self._parser = parser
         return chain, parser
 
-    def sanitize_json(self, text: str) -> str:
-        text = text.replace("```json", "").replace("```", "").strip()
-        m = re.search(r"\{[\s\S]*\}", text)
-        if m:
-            text = m.group(0)
-        text = re.sub(r",\s*}", "}", text)
-        text = re.sub(r",\s*]", "]", text)
-        return text
-
-
-    def create_questions(self, input_request: dict):
+    def _check_request(self, input_request: dict):
         if "topic" not in input_request:
             raise KeyError("Input request must contain the topic related to which you want questions")
         
@@ -76,31 +137,130 @@ Suject: {subject}
 
         elif "num_questions" not in input_request:
             raise KeyError("Input request must contain the number of questions you want related to the topic")
+
+    def _prompt_inputs(self, input_request: dict) -> dict:
+        """
+        Request plus the prompt text of its `existing_questions` list.
+        """
+        existing = list(input_request.get("existing_questions") or [])[-MAX_EXISTING_QUESTIONS:]
+        inputs = dict(input_request)
+        inputs["existing_questions"] = "\n".join(f"- {q}" for q in existing) or "None"
+        return inputs
+
+    def _cache_key(self, input_request: dict):
+        if self.cache is None:
+            return None
+        inputs = {k: input_request.get(k) for k in CACHE_FIELDS}
+        return self.cache.make_key("questions", self.model_name, self.prompt_version, inputs)
+
+    def _parse(self, raw, input_request: dict) -> dict:
+        # the model may leave out what the request already knows
+        defaults = {"topic_id": input_request.get("topic_id"), "topic": input_request.get("topic")}
+        try:
+            parsed = parse_model_output(raw, OutputResponse, defaults)
+        except Exception:
+            self.parse_stats["failed"] += 1
+            raise
+        self.parse_stats["parsed"] += 1
+        return parsed
+
+    def create_questions(self, input_request: dict):
+        self._check_request(input_request)
         
         try:
+
+            key = self._cache_key(input_request)
+            if key is not None:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    return cached
             
-            chain, parser = self.chain_creator()
+            chain = self._budgeted_chain(self._token_budget(input_request))
 
-            raw = chain.invoke(input_request)
+            raw = chain.invoke(self._prompt_inputs(input_request))
 
-            # Extract actual text reliably
-            if isinstance(raw, dict) and "text" in raw:
-                output = raw["text"]
+            result = self._parse(raw, input_request)
 
-            elif isinstance(raw, dict) and "generated_text" in raw:
-                output = raw["generated_text"]
+            if key is not None and result:
+                self.cache.set(key, result)
 
-            elif hasattr(raw, "generations"):
-                output = raw.generations[0][0].text
+            return result
 
-            elif isinstance(raw, list) and isinstance(raw[0], dict) and "generated_text" in raw[0]:
-                output = raw[0]["generated_text"]
+        except Exception as e:
+            print(f"Some error occured! Details: {e}")
 
+    def create_questions_batch(self, inputs: List[dict]) -> List[dict]:
+        """
+        Questions for many topics in one pass over the LLM.
+        Returns one entry per input, {} for the topics that failed.
+        """
+        results = [{} for _ in inputs]
+        keys = [self._cache_key(request) for request in inputs]
+
+        # only topics missing from the cache go to the LLM
+        pending = []
+        for i, key in enumerate(keys):
+            cached = self.cache.get(key) if key is not None else None
+            if cached is not None:
+                results[i] = cached
             else:
-                output = str(raw)
+                pending.append(i)
+
+        if not pending:
+            return results
 
-            cleaned = self.sanitize_json(output)
-            return parser.parse(cleaned)
+        try:
+            for i in pending:
+                self._check_request(inputs[i])
 
+            # one budget for the whole batch, rows still stop at their own JSON end
+            chain = self._budgeted_chain(max(self._token_budget(inputs[i]) for i in pending))
+            raws = chain.batch([self._prompt_inputs(inputs[i]) for i in pending], return_exceptions=True)
         except Exception as e:
-            print(f"Some error occured! Details: {e}")
\ No newline at end of file
+            print(f"Some error occured! Details: {e}")
+            return results
+
+        for i, raw in zip(pending, raws):
+            try:
+                if isinstance(raw, Exception):
+                    raise raw
+                results[i] = self._parse(raw, inputs[i])
+            except Exception as e:
+                print(f"Some error occured! Details: {e}")
+                continue
+
+            if keys[i] is not None and results[i]:
+                self.cache.set(keys[i], results[i])
+
+        return results
+
+    def stream_questions(self, input_request: dict):
+        """
+        Yields ("token", text) while generating, ("question", text) as soon as
+        each question parses, then ("result", parsed) for the complete JSON.
+        """
+        self._check_request(input_request)
+
+        key = self._cache_key(input_request)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                for question in cached.get("questions", []):
+                    yield "question", question
+                yield "result", cached
+                return
+
+        chain = self._budgeted_chain(self._token_budget(input_request))
+        items = JsonArrayItemStream("questions")
+
+        for chunk in chain.stream(self._prompt_inputs(input_request)):
+            yield "token", chunk
+            for question in items.feed(chunk):
+                yield "question", question
+
+        result = self._parse(items.buffer, input_request)
+
+        if key is not None and result:
+            self.cache.set(key, result)
+
+        yield "result", result
@@ -0,0 +1,171 @@
+"""
+Content-addressed, disk-backed cache for deterministic LLM results.
+
+Generation is greedy (do_sample=False), so the same normalized inputs,
+model and prompt version always give the same output. Results are stored
+in SQLite and evicted least-recently-used once `max_entries` is exceeded.
+A hit only records its access time in memory; the times are written with
+the next insert (or every TOUCH_FLUSH_SIZE hits), so reads never commit.
+
+USAGE :
+--------------------------------
+from ai_ml.ResultCache import ResultCache
+cache = ResultCache("cache/llm_results.sqlite3", max_entries=50000)
+key = ResultCache.make_key("evaluation", model_name, "v1", inputs)
+result = cache.get(key)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+# pending access times written at once when this many hits have piled up
+TOUCH_FLUSH_SIZE = 1024
+
+
+class ResultCache:
+    def __init__(self, path: str, max_entries: int = 50000):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # a crash can only lose the last commits, not corrupt the cache
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)"
+        )
+        self._conn.commit()
+
+        self._size = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        # key -> last access not written yet
+        self._touched = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    #   KEYS
+    @classmethod
+    def _normalize(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            return " ".join(value.split())
+        if isinstance(value, bool) or value is None:
+            return value
+        if isinstance(value, (int, float)):
+            return float(value)
+        if isinstance(value, dict):
+            return {str(k): cls._normalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [cls._normalize(v) for v in value]
+        return str(value)
+
+    @classmethod
+    def make_key(cls, task: str, model_name: str, prompt_version: str, inputs: dict) -> str:
+        payload = json.dumps(
+            {
+                "task": task,
+                "model": model_name,
+                "prompt_version": prompt_version,
+                "inputs": cls._normalize(inputs),
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    #   PUBLIC API
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM results WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self._misses += 1
+                return None
+
+            self._touched[key] = time.time()
+            if len(self._touched) >= TOUCH_FLUSH_SIZE:
+                self._flush_touched()
+                self._conn.commit()
+            self._hits += 1
+
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        data = json.dumps(value, ensure_ascii=False)
+
+        with self._lock:
+            existed = self._conn.execute(
+                "SELECT 1 FROM results WHERE key = ?", (key,)
+            ).fetchone()
+
+            self._touched.pop(key, None)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, last_access) VALUES (?, ?, ?)",
+                (key, data, time.time()),
+            )
+            if not existed:
+                self._size += 1
+
+            # eviction must see the access times of recent hits
+            self._flush_touched()
+            if self._size > self.max_entries:
+                self._evict()
+
+            self._conn.commit()
+
+    def _flush_touched(self):
+        # caller holds the lock and commits
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE results SET last_access = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _evict(self):
+        # Drop ~10% at once so eviction does not run on every insert
+        overflow = self._size - self.max_entries
+        count = max(overflow, self.max_entries // 10, 1)
+
+        self._conn.execute(
+            """
+            DELETE FROM results WHERE key IN (
+                SELECT key FROM results ORDER BY last_access ASC LIMIT ?
+            )
+            """,
+            (count,),
+        )
+        size = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        self._evictions += self._size - size
+        self._size = size
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": self._size,
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+            }
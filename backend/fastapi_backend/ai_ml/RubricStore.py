@@ -0,0 +1,139 @@
+"""
+Persistent store of generated rubrics.
+
+Rubrics are stored in SQLite under a rubric ID: a hash of the normalized
+question text and the marks, so the same question always maps to the same
+ID and an exam revisited later does not go through the LLM again.
+Evaluation requests reference stored rubrics by ID instead of resending
+them. Beyond `max_entries` the oldest rubrics are evicted; an evaluation
+referencing an evicted ID gets a 404 and has to send the rubric again.
+
+USAGE :
+--------------------------------
+from ai_ml.RubricStore import RubricStore
+store = RubricStore("cache/rubrics.sqlite3", max_entries=100000)
+rubric_id = store.put(question_text, max_marks, ["Defines X", "Gives an example"])
+entry = store.get(rubric_id)     # {"rubric_id", "question_text", "max_marks", "rubrics"}
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+
+class RubricStore:
+    def __init__(self, path: str, max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rubrics (
+                rubric_id TEXT PRIMARY KEY,
+                question_text TEXT NOT NULL,
+                max_marks REAL NOT NULL,
+                rubrics TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS rubrics_created_at ON rubrics (created_at)"
+        )
+        self._conn.commit()
+
+        self._size = self._conn.execute("SELECT COUNT(*) FROM rubrics").fetchone()[0]
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def rubric_id(question_text: str, max_marks: float) -> str:
+        payload = json.dumps(
+            {"question_text": " ".join(question_text.split()), "max_marks": float(max_marks)},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+    def get(self, rubric_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT question_text, max_marks, rubrics FROM rubrics WHERE rubric_id = ?",
+                (rubric_id,)
+            ).fetchone()
+
+            if row is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+
+        return {
+            "rubric_id": rubric_id,
+            "question_text": row[0],
+            "max_marks": row[1],
+            "rubrics": json.loads(row[2]),
+        }
+
+    def lookup(self, question_text: str, max_marks: float) -> Optional[dict]:
+        return self.get(self.rubric_id(question_text, max_marks))
+
+    def put(self, question_text: str, max_marks: float, rubrics: List[str]) -> str:
+        rubric_id = self.rubric_id(question_text, max_marks)
+        data = json.dumps(rubrics, ensure_ascii=False)
+
+        with self._lock:
+            existed = self._conn.execute(
+                "SELECT 1 FROM rubrics WHERE rubric_id = ?", (rubric_id,)
+            ).fetchone()
+
+            self._conn.execute(
+                "INSERT OR REPLACE INTO rubrics (rubric_id, question_text, max_marks, rubrics, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (rubric_id, question_text, float(max_marks), data, time.time()),
+            )
+            if not existed:
+                self._size += 1
+
+            if self._size > self.max_entries:
+                self._evict()
+
+            self._conn.commit()
+
+        return rubric_id
+
+    def _evict(self):
+        # oldest first, ~10% at once so eviction does not run on every insert
+        count = max(self._size - self.max_entries, self.max_entries // 10, 1)
+
+        self._conn.execute(
+            """
+            DELETE FROM rubrics WHERE rubric_id IN (
+                SELECT rubric_id FROM rubrics ORDER BY created_at ASC LIMIT ?
+            )
+            """,
+            (count,),
+        )
+        size = self._conn.execute("SELECT COUNT(*) FROM rubrics").fetchone()[0]
+        self._evictions += self._size - size
+        self._size = size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": self._size,
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
@@ -2,12 +2,25 @@ from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 
 from ai_ml.ModelCreator import HFModelCreation
+from ai_ml.BatchScheduler import BatchedLLM
+from ai_ml.ConstrainedDecoding import schema_option
+from ai_ml.GenerationControl import STOP_AT_JSON_END_OPTION, token_budget
+from ai_ml.PrefixCache import PROMPT_PREFIX_OPTION, static_prefix
+from ai_ml.StreamingJson import JsonArrayItemStream
+from ai_ml.OutputParsing import parse_model_output
 
 from pydantic import BaseModel, Field
 from typing import List, Dict, Annotated, Optional
 
-import re
-import json
+
+# Bump whenever the template or generation settings change (invalidates cached rubrics)
+PROMPT_VERSION = "v3"
+
+# Inputs that decide the rubrics (question_id is only echoed back)
+CACHE_FIELDS = ("question_text", "max_marks")
+
+# Generation is greedy, so a regenerated rubric is sampled to come out different
+REGENERATE_OPTIONS = {"do_sample": True, "temperature": 0.7}
 
 
 class RubricsResponse(BaseModel):
@@ -21,33 +34,94 @@ class RubricsResponse(BaseModel):
 
 
 class RubricsEngine():
-    def __init__(self, model_name: str, global_model=None):
+    def __init__(self, model_name: str, global_model=None, cache=None, constrained: bool = False,
+                 max_new_tokens: int = 600):
         self.model_name = model_name
         self.model = global_model
+        self.cache = cache
+
+        # constrained decoding can only emit JSON matching RubricsResponse
+        self.constrained = constrained
+        self.prompt_version = PROMPT_VERSION + ("-json" if constrained else "")
+        self.parse_stats = {"parsed": 0, "failed": 0}
+
+        # upper bound for the per-request token budget
+        self.max_new_tokens = max_new_tokens
+
+        # prompt and parser are built once; one chain per token budget (budgets
+        # are rounded to multiples of 32) is reused for every request
+        self._prompt = None
+        self._prefix = None
+        self._parser = None
+        self._chains = {}
 
     def get_model(self):
         if self.model is None:
-            self.model = HFModelCreation.hf_model_creator(self.model_name)
+            # standalone use: the scheduler applies the generation options
+            model = HFModelCreation.hf_model_creator(self.model_name, max_new_tokens=self.max_new_tokens)
+            self.model = BatchedLLM.from_llm(model, max_batch_size=1) if model is not None else None
         return self.model
 
-    def sanitize_json(self, text: str) -> str:
-        text = text.replace("```json", "").replace("```", "").strip()
-        m = re.search(r"\{[\s\S]*\}", text)
-        if m:
-            text = m.group(0)
-        text = re.sub(r",\s*}", "}", text)
-        text = re.sub(r",\s*]", "]", text)
-        return text
+    def _token_budget(self, input_features: dict) -> int:
+        """
+        The question is echoed back, then roughly one rubric point per mark.
+        """
+        question = str(input_features.get("question_text", ""))
+        max_marks = min(int(input_features.get("max_marks") or 0), 20)
+        return token_budget(96 + len(question) // 3 + 28 * max_marks, self.max_new_tokens)
+
+    def _bind_options(self, max_new_tokens: int = None, regenerate: bool = False):
+        options = {STOP_AT_JSON_END_OPTION: True}
+        if regenerate:
+            options.update(REGENERATE_OPTIONS)
+        if self._prefix:
+            options[PROMPT_PREFIX_OPTION] = self._prefix
+        if max_new_tokens is not None:
+            options["max_new_tokens"] = max_new_tokens
+        if self.constrained:
+            options.update(schema_option(RubricsResponse))
+        return self.get_model().bind(pipeline_kwargs=options)
+
+    def _budgeted_chain(self, max_new_tokens: int = None, regenerate: bool = False):
+        """
+        The engine's chain with `max_new_tokens` sized for the request.
+        """
+        key = (max_new_tokens, regenerate)
+        chain = self._chains.get(key)
+        if chain is None:
+            self.create_rubrics_chain()
+            chain = self._chains[key] = self._prompt | self._bind_options(max_new_tokens, regenerate)
+        return chain
+
+    def _parse(self, raw, input_features: dict) -> dict:
+        # the model may leave out what the request already knows
+        defaults = {
+            "question_id": input_features.get("question_id"),
+            "question_text": input_features.get("question_text"),
+        }
+        try:
+            parsed = parse_model_output(raw, RubricsResponse, defaults)
+        except Exception:
+            self.parse_stats["failed"] += 1
+            raise
+        self.parse_stats["parsed"] += 1
+        return parsed
 
     def create_rubrics_chain(self):
 
+        if (None, False) in self._chains:
+            return self._chains[(None, False)], self._parser
+
         try:
+            # only for the format instructions; ai_ml.OutputParsing parses the output
             parser = JsonOutputParser(pydantic_object=RubricsResponse)
 
             template = """
 You are an exam evaluator.
 Generate marking rubrics for the given question.
 
+{format_instructions}
+
 Return ONLY valid JSON in the following format:
 
 {{
@@ -58,8 +132,6 @@ Return ONLY valid JSON in the following format:
 
 Question: {question_text}
 Total Marks: {max_marks}
-
-{format_instructions}
 """
 
             prompt = PromptTemplate(
@@ -70,74 +142,145 @@ Total Marks: {max_marks}
                 }
             )
 
-            chain = prompt | self.get_model()
+            # static head first, so its KV cache is shared by every request
+            self._prompt, self._prefix = prompt, static_prefix(prompt)
+            chain = self._chains[(None, False)] = prompt | self._bind_options()
+
+            self._parser = parser
             return chain, parser
 
         except Exception as e:
             print("Rubric chain creation error:", e)
             return ""
 
+    def _check_features(self, input_features: dict):
+        if "max_marks" not in input_features:
+            raise KeyError(
+                "Input features must contain the maximum marks of question")
+
+        elif "question_text" not in input_features:
+            raise KeyError("Input features must contain the question")
+
+    def _cache_key(self, input_features: dict):
+        if self.cache is None:
+            return None
+        inputs = {k: input_features.get(k) for k in CACHE_FIELDS}
+        return self.cache.make_key("rubrics", self.model_name, self.prompt_version, inputs)
+
+    def _cached(self, key, input_features: dict):
+        # a regenerated rubric skips the lookup, it then replaces the entry
+        if key is None or input_features.get("regenerate"):
+            return None
+        return self.cache.get(key)
+
     def create_rubrics(self, input_features: dict):
 
         try:
-            if "max_marks" not in input_features:
-                raise KeyError(
-                    "Input features must contain the maximum marks of question")
+            self._check_features(input_features)
 
-            elif "question_text" not in input_features:
-                raise KeyError("Input features must contain the question")
+            key = self._cache_key(input_features)
+            cached = self._cached(key, input_features)
+            if cached is not None:
+                return cached
 
-            chain, parser = self.create_rubrics_chain()
+            chain = self._budgeted_chain(
+                self._token_budget(input_features), bool(input_features.get("regenerate"))
+            )
 
             raw = chain.invoke(input_features)
 
-            # Extract actual text reliably from various return shapes
-            output = None
-
-            # common return shapes
-            if isinstance(raw, dict):
-                # hf pipeline or similar
-                if "text" in raw:
-                    output = raw["text"]
-                elif "generated_text" in raw:
-                    output = raw["generated_text"]
-                else:
-                    # sometimes pipelines return {"output_text": ...}
-                    if "output_text" in raw:
-                        output = raw["output_text"]
-                    else:
-                        output = json.dumps(raw)  # fallback
-
-            elif hasattr(raw, "generations"):
-                # LangChain-like object
-                try:
-                    output = raw.generations[0][0].text
-                except Exception:
-                    output = str(raw)
-
-            elif isinstance(raw, list) and len(raw) > 0:
-                first = raw[0]
-                if isinstance(first, dict) and "generated_text" in first:
-                    output = first["generated_text"]
-                else:
-                    output = str(raw)
-
-            else:
-                output = str(raw)
-
-            cleaned = self.sanitize_json(output)
+            result_dict = self._parse(raw, input_features)
 
-            # parser.parse returns a pydantic model instance - return its dict
-            parsed = parser.parse(cleaned)
-            # convert to dict for downstream code to inspect easily
-            try:
-                result_dict = parsed.model_dump() if hasattr(
-                    parsed, "model_dump") else dict(parsed)
-            except Exception:
-                result_dict = parsed if isinstance(
-                    parsed, dict) else json.loads(cleaned)
+            if key is not None and result_dict:
+                self.cache.set(key, result_dict)
 
             return result_dict
 
         except Exception as e:
             print("Rubrics creation error. Details: ", e)
+
+    def create_rubrics_batch(self, inputs: List[dict]) -> List[dict]:
+        """
+        Rubrics for many questions in one pass over the LLM.
+        Returns one entry per input, {} for the questions that failed.
+        """
+        results = [{} for _ in inputs]
+        keys = [self._cache_key(features) for features in inputs]
+
+        # only questions missing from the cache go to the LLM
+        pending = []
+        for i, key in enumerate(keys):
+            cached = self._cached(key, inputs[i])
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.append(i)
+
+        if not pending:
+            return results
+
+        try:
+            for i in pending:
+                self._check_features(inputs[i])
+
+            # regenerated rubrics are sampled, so they go in their own batch
+            groups = [
+                (regenerate, [i for i in pending if bool(inputs[i].get("regenerate")) == regenerate])
+                for regenerate in (False, True)
+            ]
+            outputs = []
+            for regenerate, group in groups:
+                if not group:
+                    continue
+                # one budget for the whole batch, rows still stop at their own JSON end
+                chain = self._budgeted_chain(max(self._token_budget(inputs[i]) for i in group), regenerate)
+                outputs.extend(zip(group, chain.batch([inputs[i] for i in group], return_exceptions=True)))
+        except Exception as e:
+            print("Batch rubrics creation error:", e)
+            return results
+
+        for i, raw in outputs:
+            try:
+                if isinstance(raw, Exception):
+                    raise raw
+                results[i] = self._parse(raw, inputs[i])
+            except Exception as e:
+                print("Rubrics creation error. Details: ", e)
+                continue
+
+            if keys[i] is not None and results[i]:
+                self.cache.set(keys[i], results[i])
+
+        return results
+
+    def stream_rubrics(self, input_features: dict):
+        """
+        Yields ("token", text) while generating, ("rubric", text) as soon as
+        each rubric point parses, then ("result", dict) for the complete JSON.
+        """
+        self._check_features(input_features)
+
+        key = self._cache_key(input_features)
+        cached = self._cached(key, input_features)
+        if cached is not None:
+            for rubric in cached.get("rubrics", []):
+                yield "rubric", rubric
+            yield "result", cached
+            return
+
+        chain = self._budgeted_chain(
+            self._token_budget(input_features), bool(input_features.get("regenerate"))
+        )
+        items = JsonArrayItemStream("rubrics")
+
+        for chunk in chain.stream(input_features):
+            yield "token", chunk
+            for rubric in items.feed(chunk):
+                yield "rubric", rubric
+
+        result = self._parse(items.buffer, input_features)
+
+        if key is not None and result:
+            self.cache.set(key, result)
+
+        yield "result", result
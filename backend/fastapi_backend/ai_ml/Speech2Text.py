@@ -10,11 +10,18 @@ print(stt.transcription_list)
 
 USAGE (recommended with preloaded Whisper model):
 -------------------------------------------------
-from app.main import whisper_model
+from app.core import models
 from ai_ml.Speech2Text import STT
 
-stt = STT(lang="en", model="whisper", audio_file_name=audio_file_path)
-text = stt.transcribe_with_existing_model(whisper_model, audio_file_path)
+stt = STT(lang="en", model="whisper", audio_file_name=upload.filename, audio_bytes=upload_bytes)
+text = stt.transcribe_with_existing_model(models.whisper_model)
+
+Both models get the preprocessed audio (16 kHz float32, silence trimmed by
+VAD) as an array, so the upload is decoded exactly once.
+
+With batch_size > 1 a long answer is transcribed in batches: Whisper decodes
+the 30 s preprocessing chunks `batch_size` at a time and stitches their text
+(ai_ml.LongFormTranscription), the HF pipeline gets chunk_length_s/batch_size.
 """
 
 from __future__ import annotations
@@ -23,33 +30,62 @@ warnings.filterwarnings("ignore")
 
 # Imports
 
+from typing import Optional
+
+import numpy as np
 from transformers import pipeline
 
 from ai_ml.AIExceptions import IllegalModelSelectionException
-from ai_ml.AudioPreprocessor import AudioPreprocessor
+from ai_ml.AudioPreprocessor import AudioPreprocessor, AudioPreprocessorConfig, PreprocessResult
+from ai_ml.LongFormTranscription import WHISPER_WINDOW_SEC, stitch_transcripts, whisper_transcribe_chunks
 from ai_ml.ModelCreator import SpeechModelGenerator
 
 #   STT MAIN CLASS
 class STT:
-    def __init__(self, lang: str, model: str, audio_file_name: str):
+    def __init__(
+        self,
+        lang: str,
+        model: str,
+        audio_file_name: str,
+        audio_bytes: Optional[bytes] = None,
+        batch_size: int = 1,
+        chunk_overlap_sec: float = 1.0,
+    ):
         """
         model = "whisper" OR "hf"
+        audio_bytes = upload held in memory (audio_file_name is then only its name)
+        batch_size = chunks decoded per forward pass for long answers (1 = sequential)
         """
         self.lang = lang.lower()
         self.model = model.lower()
         self.audio_file_name = audio_file_name
+        self.audio_bytes = audio_bytes
         self.transcription_list: list[str] = []
         self.new_student: bool = True
+        self.preprocessed: Optional[PreprocessResult] = None
+        self.batch_size = max(1, batch_size)
+        self.chunk_overlap_sec = chunk_overlap_sec
 
      
     #   PREPROCESS     
-    def audio_preprocess(self) -> str:
+    def audio_preprocess(self) -> np.ndarray:
         """
-        Run audio preprocessing and return processed file path.
+        Decode and VAD-trim the audio once, return the 16 kHz float32 array.
         """
-        preprocessor = AudioPreprocessor()
-        result = preprocessor.preprocess_file(self.audio_file_name)
-        return result.metadata.processed_path
+        if self.preprocessed is None:
+            config = None
+            if self.batch_size > 1:
+                # chunks of one Whisper window, decoded side by side
+                config = AudioPreprocessorConfig(
+                    chunk_duration_sec=WHISPER_WINDOW_SEC,
+                    chunk_overlap_sec=self.chunk_overlap_sec,
+                )
+            preprocessor = AudioPreprocessor(config)
+            if self.audio_bytes is not None:
+                self.preprocessed = preprocessor.preprocess_bytes(self.audio_bytes, name=self.audio_file_name)
+            else:
+                self.preprocessed = preprocessor.preprocess_file(self.audio_file_name)
+        return self.preprocessed.audio
 
      
     #   LOCAL WHISPER TRANSCRIBE     
@@ -60,26 +96,44 @@ class STT:
         """
         try:
             whisper_model = SpeechModelGenerator.whisper_model_generator()
-            audio_path = self.audio_preprocess()
-
-            output = whisper_model.transcribe(audio_path, language=self.lang)
-            if isinstance(output, dict) and "text" in output:
-                return output["text"]
-
-            print("Unexpected Whisper output:", output)
-            return ""
+            return self._whisper_run(whisper_model, self.lang)
         except Exception as e:
             print("Error while accessing Whisper model:", e)
             return ""
 
+    def _whisper_run(self, whisper_model, lang: str) -> str:
+        audio = self.audio_preprocess()
+
+        chunks = self.preprocessed.chunks
+        if self.batch_size > 1 and len(chunks) > 1:
+            texts = whisper_transcribe_chunks(whisper_model, chunks, language=lang, batch_size=self.batch_size)
+            return stitch_transcripts(texts, self.preprocessed.chunk_overlaps)
+
+        output = whisper_model.transcribe(audio, language=lang)
+        if isinstance(output, dict) and "text" in output:
+            return output["text"]
+
+        print("Unexpected Whisper output:", output)
+        return ""
+
      
     #   HF WHISPER PIPELINE     
     def hf_transcribe(self) -> str:
         try:
             pipeline_model = SpeechModelGenerator.hf_model_generator()
-            audio_path = self.audio_preprocess()
-
-            result = pipeline_model(audio_path)
+            audio = self.audio_preprocess()
+
+            inputs = {"raw": audio, "sampling_rate": self.preprocessed.sample_rate}
+            if self.batch_size > 1 and self.preprocessed.metadata.duration_sec > WHISPER_WINDOW_SEC:
+                # the pipeline chunks with its own stride and merges the overlaps
+                result = pipeline_model(
+                    inputs,
+                    chunk_length_s=WHISPER_WINDOW_SEC,
+                    stride_length_s=self.chunk_overlap_sec or None,
+                    batch_size=self.batch_size,
+                )
+            else:
+                result = pipeline_model(inputs)
 
             # Handle: [{"text": "..."}]
             if isinstance(result, list) and result and isinstance(result[0], dict):
@@ -131,22 +185,19 @@ class STT:
 
      
     #   TRANSCRIBE WITH PRE-LOADED MODEL
-    def transcribe_with_existing_model(self, whisper_model, audio_file_path, lang=None):
+    def transcribe_with_existing_model(self, whisper_model, audio_file_path=None, lang=None):
         """
         Uses a preloaded whisper model (from FastAPI startup)
         → NO reloading
         → FAST response
+        audio_file_path defaults to this STT's own audio
         """
         try:
             lang = lang or self.lang
 
-            output = whisper_model.transcribe(audio_file_path, language=lang)
-
-            if isinstance(output, dict) and "text" in output:
-                return output["text"]
-
-            print("Unexpected Whisper output:", output)
-            return ""
+            if audio_file_path is not None and audio_file_path != self.audio_file_name:
+                self.audio_file_name, self.audio_bytes, self.preprocessed = audio_file_path, None, None
+            return self._whisper_run(whisper_model, lang)
         except Exception as e:
             print("Whisper transcription failed:", e)
             return ""
@@ -0,0 +1,79 @@
+"""
+Incremental extraction of string items from a JSON array while the LLM is
+still generating it.
+
+USAGE :
+--------------------------------
+from ai_ml.StreamingJson import JsonArrayItemStream
+items = JsonArrayItemStream("questions")
+for chunk in chain.stream(inputs):
+    for question in items.feed(chunk):
+        print(question)          # each question as soon as its string closes
+"""
+
+import json
+import re
+from typing import List, Optional
+
+
+class JsonArrayItemStream:
+    def __init__(self, key: str):
+        self._start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self.buffer = ""
+        self._pos: Optional[int] = None
+        self._done = False
+
+    @staticmethod
+    def _string_end(text: str, start: int) -> Optional[int]:
+        i = start + 1
+        while i < len(text):
+            c = text[i]
+            if c == "\\":
+                i += 2
+                continue
+            if c == '"':
+                return i
+            i += 1
+        return None
+
+    def feed(self, text: str) -> List[str]:
+        """
+        Add generated text, return the array items completed by it.
+        """
+        self.buffer += text
+        items: List[str] = []
+
+        if self._done:
+            return items
+
+        if self._pos is None:
+            match = self._start.search(self.buffer)
+            if match is None:
+                return items
+            self._pos = match.end()
+
+        while True:
+            i = self._pos
+            while i < len(self.buffer) and self.buffer[i] in " \t\r\n,":
+                i += 1
+            self._pos = i
+
+            if i >= len(self.buffer):
+                return items
+
+            # end of the array, or items that are not plain strings
+            if self.buffer[i] != '"':
+                self._done = True
+                return items
+
+            end = self._string_end(self.buffer, i)
+            if end is None:
+                return items
+
+            try:
+                items.append(json.loads(self.buffer[i:end + 1]))
+            except ValueError:
+                self._done = True
+                return items
+
+            self._pos = end + 1
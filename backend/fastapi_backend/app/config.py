@@ -1,4 +1,6 @@
 # config.py
+from typing import Literal
+
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -7,6 +9,104 @@ class Settings(BaseSettings):
     STT_DEFAULT_MODEL: str = "whisper"
     MCQ_EVAL_MODEL_NAME: str = "sentence-transformers/all-MiniLM-L6-v2"
 
+    # Deadline of a request in seconds unless the X-Request-Timeout header sets one
+    # (0 = none); batch, streaming and STT routes routinely run past a minute, so
+    # callers that need a deadline send the header
+    REQUEST_TIMEOUT_SECONDS: float = 0.0
+
+    # Max concurrent inference calls per model class
+    LLM_MAX_CONCURRENCY: int = 8
+    WHISPER_MAX_CONCURRENCY: int = 1
+    ST_MAX_CONCURRENCY: int = 2
+
+    # Long answers: 30 s chunks transcribed this many per forward pass; 1 = sequential
+    # Whisper transcribe, the default until batched decoding is checked against it.
+    # Consecutive chunks cut mid-speech share STT_CHUNK_OVERLAP_SEC of audio
+    STT_BATCH_SIZE: int = 1
+    STT_CHUNK_OVERLAP_SEC: float = 1.0
+
+    # Micro-batching of concurrent LLM prompts (1 disables batching)
+    LLM_BATCH_MAX_SIZE: int = 8
+    LLM_BATCH_WINDOW_MS: int = 25
+
+    # LLM backend: "transformers" (HF_EVAL_MODEL_NAME) or "llama_cpp" (quantized GGUF on CPU)
+    LLM_BACKEND: Literal["transformers", "llama_cpp"] = "transformers"
+    LLM_GGUF_PATH: str = ""
+    LLM_GGUF_N_CTX: int = 4096
+    LLM_GGUF_N_THREADS: int = 0   # 0 = all physical cores
+    LLM_GGUF_N_BATCH: int = 512
+
+    # Optimized CPU mode for the transformers LLM: "" (off), "bf16" or "int8"
+    LLM_CPU_OPTIMIZATION: Literal["", "bf16", "int8"] = ""
+    LLM_TORCH_COMPILE: bool = False
+
+    # Reuse the KV cache of the static prompt head (instructions, format instructions);
+    # opt-in, it only applies to prompts generated alone (LLM_BATCH_MAX_SIZE batches skip it)
+    LLM_PREFIX_CACHE_ENABLED: bool = False
+
+    # Small draft model for assisted decoding, must share the LLM's tokenizer (empty = off)
+    LLM_DRAFT_MODEL_NAME: str = ""
+
+    # Upper bound of the per-request token budget of the LLM engines
+    LLM_MAX_NEW_TOKENS: int = 4096
+
+    # Constrain LLM output to the response JSON schema (needs lm-format-enforcer)
+    LLM_CONSTRAINED_JSON: bool = False
+
+    # Packed evaluation: /evaluate/batch grades several answers per prompt,
+    # items the pack does not grade validly are re-run one per prompt
+    EVAL_PACKING_ENABLED: bool = False
+    EVAL_PACK_MAX_ITEMS: int = 8
+    EVAL_PACK_MAX_PROMPT_TOKENS: int = 2048
+
+    # Disk cache of deterministic LLM results (grades, rubrics, questions)
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_PATH: str = "cache/llm_results.sqlite3"
+    RESULT_CACHE_MAX_ENTRIES: int = 50000
+
+    # Persistent rubric store, evaluation requests can reference rubrics by ID
+    RUBRIC_STORE_ENABLED: bool = True
+    RUBRIC_STORE_PATH: str = "cache/rubrics.sqlite3"
+    RUBRIC_STORE_MAX_ENTRIES: int = 100000   # oldest rubrics evicted beyond this
+
+    # Per-topic pool of generated questions, near-duplicates (cosine) are dropped
+    QUESTION_POOL_ENABLED: bool = True
+    QUESTION_POOL_PATH: str = "cache/question_pool.sqlite3"
+    QUESTION_POOL_DEDUP_THRESHOLD: float = 0.9
+    QUESTION_POOL_MAX_QUESTIONS_PER_TOPIC: int = 500
+
+    # Opt-in reuse of grades for near-identical answers to the same question
+    SEMANTIC_REUSE_ENABLED: bool = False
+    SEMANTIC_REUSE_THRESHOLD: float = 0.95
+    SEMANTIC_REUSE_MAX_ANSWERS_PER_QUESTION: int = 200
+    SEMANTIC_REUSE_MAX_QUESTIONS: int = 1000
+
+    # Deterministic grading of empty, refusal and repeated answers without the LLM
+    PREFILTER_ENABLED: bool = True
+    PREFILTER_MIN_ANSWER_CHARS: int = 0   # 0 = off, one-character answers can be right
+    # Embedding match against refusal examples; off by default because MiniLM puts
+    # "I am sure about this" close to "I am not sure about this"
+    PREFILTER_REFUSAL_EMBEDDINGS: bool = False
+    PREFILTER_REFUSAL_THRESHOLD: float = 0.85
+    PREFILTER_MAX_EXACT_MATCHES: int = 10000
+
+    # Cascade grading: cheap tier first, escalate to HF_EVAL_MODEL_NAME when unsure
+    CASCADE_ENABLED: bool = False
+    CASCADE_SMALL_MODEL_NAME: str = ""   # empty = rubric similarity scorer
+    CASCADE_CONFIDENCE_THRESHOLD: float = 0.8
+    CASCADE_HIGH_SIMILARITY: float = 0.7
+    CASCADE_LOW_SIMILARITY: float = 0.3
+
+    @property
+    def llm_model_id(self) -> str:
+        # identifies the loaded LLM in cache keys, GGUF files and quantized
+        # weights do not produce the same outputs as the HF weights
+        if self.LLM_BACKEND == "llama_cpp":
+            return self.LLM_GGUF_PATH
+        if self.LLM_CPU_OPTIMIZATION:
+            return f"{self.HF_EVAL_MODEL_NAME}:{self.LLM_CPU_OPTIMIZATION}"
+        return self.HF_EVAL_MODEL_NAME
+
     class Config:
         env_file = ".env"
         extra = "ignore"   
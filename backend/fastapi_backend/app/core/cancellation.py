@@ -0,0 +1,75 @@
+"""
+Per-request cancellation: deadline from the X-Request-Timeout header (seconds)
+or REQUEST_TIMEOUT_SECONDS, and client disconnect detection.
+
+The middleware makes a CancellationToken current for the whole request; the
+model executors, the LLM batch scheduler and the Whisper hooks check it.
+
+USAGE :
+--------------------------------
+from app.core.cancellation import CancellationMiddleware
+app.add_middleware(CancellationMiddleware)
+"""
+
+import asyncio
+
+from ai_ml.Cancellation import CancellationToken, current_token
+from app.config import settings
+
+TIMEOUT_HEADER = b"x-request-timeout"
+
+
+def _request_timeout(scope) -> float:
+    for name, value in scope.get("headers", []):
+        if name == TIMEOUT_HEADER:
+            try:
+                return max(0.0, float(value.decode()))
+            except ValueError:
+                break
+    return settings.REQUEST_TIMEOUT_SECONDS
+
+
+class CancellationMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = CancellationToken(timeout=_request_timeout(scope))
+        watcher = None
+
+        async def wait_for_disconnect():
+            # once the body is read, the next message can only be a disconnect
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                token.cancel("disconnect")
+            return message
+
+        async def cancellable_receive():
+            nonlocal watcher
+            if watcher is not None:
+                return await asyncio.shield(watcher)
+
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                token.cancel("disconnect")
+            elif not message.get("more_body", False):
+                watcher = asyncio.ensure_future(wait_for_disconnect())
+            return message
+
+        async def finishing_send(message):
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                token.finish()
+            await send(message)
+
+        reset = current_token.set(token)
+        try:
+            await self.app(scope, cancellable_receive, finishing_send)
+        finally:
+            token.finish()
+            current_token.reset(reset)
+            if watcher is not None:
+                watcher.cancel()
@@ -0,0 +1,179 @@
+"""
+Bounded execution layer for blocking model inference.
+
+Every model class (LLM, Whisper, sentence-transformer) gets its own thread
+pool so a slow Phi-3.5 generation never blocks the event loop or starves
+the other models.
+
+USAGE :
+--------------------------------
+from app.core.inference import llm_executor
+result = await llm_executor.run(evaluator_service.evaluate, payload)
+
+async for event in llm_executor.stream(generation_service.stream, payload):
+    ...
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ai_ml.Cancellation import GenerationCancelled, current_cancellation
+from app.config import settings
+
+
+class ModelExecutor:
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix=f"{name}-inference"
+        )
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        # label (service method) -> [calls, total ms]
+        self._latency = {}
+
+    @staticmethod
+    def _label(fn) -> str:
+        return getattr(fn, "__qualname__", repr(fn))
+
+    def _invoke(self, fn, args, kwargs, label):
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+        start = time.perf_counter()
+        token = current_cancellation()
+        try:
+            # queued work of a request that is already gone never starts
+            if token is not None:
+                token.raise_if_cancelled()
+
+            # a result that is already computed is returned, even past the deadline
+            result = fn(*args, **kwargs)
+            with self._lock:
+                self._completed += 1
+            return result
+        except GenerationCancelled:
+            with self._lock:
+                self._cancelled += 1
+            raise
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self._active -= 1
+                latency = self._latency.setdefault(label, [0, 0.0])
+                latency[0] += 1
+                latency[1] += elapsed_ms
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run a blocking callable on this model's pool and await its result.
+        """
+        return await self._submit(fn, args, kwargs, self._label(fn))
+
+    async def _submit(self, fn, args, kwargs, label):
+        with self._lock:
+            self._queued += 1
+
+        # the request's cancellation token travels with the context
+        context = contextvars.copy_context()
+        future = self._pool.submit(context.run, self._invoke, fn, args, kwargs, label)
+
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # Work that never started is dropped, running work finishes in its thread
+            if future.cancel():
+                with self._lock:
+                    self._queued -= 1
+            raise
+
+    async def stream(self, fn, *args, **kwargs):
+        """
+        Run a blocking generator on this model's pool and yield its items
+        as they are produced. Closing the stream stops the generator.
+        """
+        loop = asyncio.get_running_loop()
+        items: asyncio.Queue = asyncio.Queue()
+        finished = object()
+        stopped = threading.Event()
+
+        def produce():
+            try:
+                for item in fn(*args, **kwargs):
+                    if stopped.is_set():
+                        break
+                    loop.call_soon_threadsafe(items.put_nowait, item)
+            finally:
+                loop.call_soon_threadsafe(items.put_nowait, finished)
+
+        task = asyncio.ensure_future(self._submit(produce, (), {}, self._label(fn)))
+        # a cancelled request's generator never starts, so produce() never finishes
+        task.add_done_callback(lambda _: items.put_nowait(finished))
+
+        started = False
+        try:
+            while True:
+                item = await items.get()
+                if item is finished:
+                    break
+                started = True
+                yield item
+
+            try:
+                await task
+            except GenerationCancelled:
+                # once the response has started a 504 can no longer be sent
+                if not started:
+                    raise
+        finally:
+            stopped.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queued": self._queued,
+                "active": self._active,
+                "completed": self._completed,
+                "failed": self._failed,
+                "cancelled": self._cancelled,
+                "avg_ms": {
+                    label: round(total_ms / calls, 2)
+                    for label, (calls, total_ms) in self._latency.items()
+                },
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+llm_executor = ModelExecutor("llm", settings.LLM_MAX_CONCURRENCY)
+whisper_executor = ModelExecutor("whisper", settings.WHISPER_MAX_CONCURRENCY)
+st_executor = ModelExecutor("st", settings.ST_MAX_CONCURRENCY)
+
+executors = {
+    executor.name: executor
+    for executor in (llm_executor, whisper_executor, st_executor)
+}
+
+
+def executor_stats() -> dict:
+    return {name: executor.stats() for name, executor in executors.items()}
+
+
+def shutdown_executors():
+    for executor in executors.values():
+        executor.shutdown()
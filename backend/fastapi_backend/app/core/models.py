@@ -1,3 +1,9 @@
 whisper_model = None
 ai_model = None
+small_ai_model = None
 st_model = None
+result_cache = None
+rubric_store = None
+question_pool = None
+answer_index = None
+answer_prefilter = None
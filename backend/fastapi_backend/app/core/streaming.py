@@ -0,0 +1,27 @@
+"""
+Server-sent events helpers for streaming endpoints.
+"""
+
+import json
+
+from fastapi.responses import StreamingResponse
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _sse_stream(events):
+    async for event, data in events:
+        yield sse_event(event, data)
+
+
+def sse_response(events) -> StreamingResponse:
+    """
+    Wrap an async iterator of (event, data) pairs into an SSE response.
+    """
+    return StreamingResponse(
+        _sse_stream(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
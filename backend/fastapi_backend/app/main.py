@@ -1,11 +1,26 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from app.routers import stt, evaluation, tts, question_generation, rubrics, mcq_evaluation
 from contextlib import asynccontextmanager
 
 from ai_ml.ModelCreator import HFModelCreation
+from ai_ml.CPUOptimization import resident_memory_mb
+from ai_ml.BatchScheduler import BatchedLLM
+from ai_ml.ResultCache import ResultCache
+from ai_ml.RubricStore import RubricStore
+from ai_ml.QuestionPool import QuestionPool
+from ai_ml.AnswerIndex import SemanticAnswerIndex
+from ai_ml.AnswerPrefilter import AnswerPrefilter
 from ai_ml.Speech2Text import SpeechModelGenerator
+from ai_ml.AudioPreprocessor import AudioPreprocessor, preprocess_stats
 from ai_ml.MCQEvaluation import MCQEvaluationEngine
+from ai_ml.Cancellation import GenerationCancelled, cancellation_stats
 from app.core import models
+from app.core.inference import executor_stats, shutdown_executors
+from app.core.cancellation import CancellationMiddleware
+from app.services.evaluation_service import evaluator_service
+from app.services.rubrics_service import generate_rubrics_service
+from app.services.question_generation_service import generation_service
 
 from app.config import settings
 
@@ -17,21 +32,172 @@ async def lifespan(app: FastAPI):
     # preload whisper model
     models.whisper_model = SpeechModelGenerator.whisper_model_generator()
 
+    # ffmpeg decoders wait for uploads instead of starting per request
+    AudioPreprocessor().start_decoders()
+
     # preload AI model ONCE - shared across all services
-    models.ai_model = HFModelCreation.hf_model_creator(settings.HF_EVAL_MODEL_NAME)
+    ai_model = HFModelCreation.llm_creator(
+        settings.LLM_BACKEND,
+        settings.HF_EVAL_MODEL_NAME,
+        max_new_tokens=settings.LLM_MAX_NEW_TOKENS,
+        cpu_optimization=settings.LLM_CPU_OPTIMIZATION,
+        compile_model=settings.LLM_TORCH_COMPILE,
+        model_path=settings.LLM_GGUF_PATH,
+        n_ctx=settings.LLM_GGUF_N_CTX,
+        n_threads=settings.LLM_GGUF_N_THREADS,
+        n_batch=settings.LLM_GGUF_N_BATCH
+    )
+
+    # concurrent prompts are batched into one generate call (batch size 1 disables
+    # batching), the scheduler also applies generation options such as json_schema
+    if ai_model is not None:
+        # optional draft model for assisted (speculative) decoding
+        draft_model = None
+        if settings.LLM_DRAFT_MODEL_NAME and settings.LLM_BACKEND == "transformers":
+            draft_model = HFModelCreation.hf_draft_model_creator(
+                settings.LLM_DRAFT_MODEL_NAME, ai_model.pipeline.tokenizer
+            )
+
+        ai_model = BatchedLLM.from_llm(
+            ai_model,
+            max_batch_size=settings.LLM_BATCH_MAX_SIZE,
+            batch_window_ms=settings.LLM_BATCH_WINDOW_MS,
+            prefix_cache=settings.LLM_PREFIX_CACHE_ENABLED,
+            draft_model=draft_model
+        )
+
+    models.ai_model = ai_model
+
+    # optional small first-tier model for cascade grading
+    if settings.CASCADE_ENABLED and settings.CASCADE_SMALL_MODEL_NAME:
+        small_ai_model = HFModelCreation.hf_model_creator(
+            settings.CASCADE_SMALL_MODEL_NAME, max_new_tokens=settings.LLM_MAX_NEW_TOKENS
+        )
+        if small_ai_model is not None:
+            small_ai_model = BatchedLLM.from_llm(
+                small_ai_model,
+                max_batch_size=settings.LLM_BATCH_MAX_SIZE,
+                batch_window_ms=settings.LLM_BATCH_WINDOW_MS,
+                prefix_cache=settings.LLM_PREFIX_CACHE_ENABLED
+            )
+        models.small_ai_model = small_ai_model
+
+    if settings.RESULT_CACHE_ENABLED:
+        models.result_cache = ResultCache(
+            settings.RESULT_CACHE_PATH,
+            max_entries=settings.RESULT_CACHE_MAX_ENTRIES
+        )
+
+    if settings.RUBRIC_STORE_ENABLED:
+        models.rubric_store = RubricStore(settings.RUBRIC_STORE_PATH,
+                                          max_entries=settings.RUBRIC_STORE_MAX_ENTRIES)
 
     # preload Sentence Transformers model for similarity score
     models.st_model = MCQEvaluationEngine(settings.MCQ_EVAL_MODEL_NAME)
 
+    # rules (+ opt-in refusal embeddings) settle trivial answers before the LLM
+    if settings.PREFILTER_ENABLED:
+        models.answer_prefilter = AnswerPrefilter(
+            settings.HF_EVAL_MODEL_NAME,
+            encoder=models.st_model.get_model() if settings.PREFILTER_REFUSAL_EMBEDDINGS else None,
+            min_answer_chars=settings.PREFILTER_MIN_ANSWER_CHARS,
+            refusal_threshold=settings.PREFILTER_REFUSAL_THRESHOLD,
+            max_exact_matches=settings.PREFILTER_MAX_EXACT_MATCHES
+        )
+
+    # Sentence Transformers embeddings also deduplicate the questions of each topic
+    if settings.QUESTION_POOL_ENABLED:
+        models.question_pool = QuestionPool(
+            settings.QUESTION_POOL_PATH,
+            models.st_model.get_model(),
+            threshold=settings.QUESTION_POOL_DEDUP_THRESHOLD,
+            max_questions_per_topic=settings.QUESTION_POOL_MAX_QUESTIONS_PER_TOPIC
+        )
+
+    # same Sentence Transformers model indexes graded answers for reuse
+    if settings.SEMANTIC_REUSE_ENABLED:
+        models.answer_index = SemanticAnswerIndex(
+            models.st_model.get_model(),
+            threshold=settings.SEMANTIC_REUSE_THRESHOLD,
+            max_answers_per_question=settings.SEMANTIC_REUSE_MAX_ANSWERS_PER_QUESTION,
+            max_questions=settings.SEMANTIC_REUSE_MAX_QUESTIONS
+        )
+
+    # build prompts, parsers and chains ONCE - reused by every request
+    evaluator_service.load_engine()
+    generate_rubrics_service.load_engine()
+    generation_service.load_engine()
+
     yield
 
+    shutdown_executors()
+
 app = FastAPI(title="Examecho AI Service", lifespan=lifespan)
 
+# deadline / client disconnect stops queued and running model work
+app.add_middleware(CancellationMiddleware)
+
+
+@app.exception_handler(GenerationCancelled)
+async def cancelled_handler(request: Request, exc: GenerationCancelled):
+    # a disconnected client never reads this, a missed deadline gets a 504
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
 
+@app.get("/health/inference")
+def inference_health():
+    stats = executor_stats()
+
+    if isinstance(models.ai_model, BatchedLLM):
+        stats["llm_batching"] = models.ai_model.scheduler.stats()
+
+    if models.result_cache is not None:
+        stats["result_cache"] = models.result_cache.stats()
+
+    if models.rubric_store is not None:
+        stats["rubric_store"] = models.rubric_store.stats()
+
+    if models.question_pool is not None:
+        stats["question_pool"] = models.question_pool.stats()
+
+    if models.answer_index is not None:
+        stats["semantic_reuse"] = models.answer_index.stats()
+
+    if models.answer_prefilter is not None:
+        stats["prefilter"] = models.answer_prefilter.stats()
+
+    if evaluator_service.cascade is not None:
+        stats["cascade"] = evaluator_service.cascade.stats()
+
+    stats["cancellation"] = cancellation_stats()
+
+    # load mode and resident memory of the LLMs, plus the process RSS now
+    stats["llm_memory"] = {
+        "rss_mb": resident_memory_mb(),
+        "models": HFModelCreation.load_reports,
+    }
+
+    # parse success/failure per engine (compare with LLM_CONSTRAINED_JSON on/off)
+    stats["output_parsing"] = {
+        name: service.engine.parse_stats
+        for name, service in (
+            ("evaluation", evaluator_service),
+            ("rubrics", generate_rubrics_service),
+            ("questions", generation_service),
+        )
+        if service.engine is not None
+    }
+
+    # latency and disk bytes written per audio decode mode
+    stats["audio_preprocessing"] = preprocess_stats()
+
+    return stats
+
+
 app.include_router(question_generation.router)
 app.include_router(rubrics.router)
 app.include_router(tts.router)
@@ -1,9 +1,19 @@
 from fastapi import APIRouter
-from app.schemas.evaluation import EvaluateAnswer, EvaluateAnswerResponse
+from app.schemas.evaluation import (
+    EvaluateAnswer,
+    EvaluateAnswerResponse,
+    EvaluateBatchRequest,
+    EvaluateBatchResponse,
+)
 from app.services.evaluation_service import evaluator_service
+from app.core.inference import llm_executor
 
 router = APIRouter(prefix="/evaluate", tags=["evaluation"])
 
 @router.post("/answer", response_model=EvaluateAnswerResponse)
 async def eval_route(payload: EvaluateAnswer):
-    return evaluator_service.evaluate(payload)
+    return await llm_executor.run(evaluator_service.evaluate, payload)
+
+@router.post("/batch", response_model=EvaluateBatchResponse)
+async def eval_batch_route(payload: EvaluateBatchRequest):
+    return await llm_executor.run(evaluator_service.evaluate_batch, payload)
@@ -1,6 +1,13 @@
 from fastapi import APIRouter, HTTPException
-from app.schemas.question_generation import QuestionGenerationRequest, QuestionGenerationResponse
+from app.schemas.question_generation import (
+    QuestionGenerationRequest,
+    QuestionGenerationResponse,
+    QuestionGenerationBatchRequest,
+    QuestionGenerationBatchResponse,
+)
 from app.services.question_generation_service import generation_service
+from app.core.inference import llm_executor
+from app.core.streaming import sse_response
 
 router = APIRouter(
     prefix="/questions_generate",
@@ -9,7 +16,7 @@ router = APIRouter(
 
 @router.post("/generate", response_model= QuestionGenerationResponse)
 async def generate_route(payload: QuestionGenerationRequest):
-    questions = generation_service.generate(payload)
+    questions = await llm_executor.run(generation_service.generate, payload)
 
     if not questions:
         raise HTTPException(
@@ -20,5 +27,21 @@ async def generate_route(payload: QuestionGenerationRequest):
     return questions
 
 
-
-
+@router.post("/generate/stream")
+async def generate_stream_route(payload: QuestionGenerationRequest, include_tokens: bool = False):
+    """
+    SSE variant of /generate: a `question` event per question as soon as it
+    parses, then a `result` event with the full response (or an `error` event).
+    """
+    return sse_response(
+        llm_executor.stream(generation_service.stream, payload, include_tokens)
+    )
+
+
+@router.post("/generate/batch", response_model=QuestionGenerationBatchResponse)
+async def generate_batch_route(payload: QuestionGenerationBatchRequest):
+    """
+    Questions for many (subject, topic) pairs in batched LLM passes; topics
+    whose question pool already has enough questions skip the LLM.
+    """
+    return await llm_executor.run(generation_service.generate_batch, payload)
@@ -1,6 +1,14 @@
 from fastapi import APIRouter, HTTPException
-from app.schemas.rubrics import RubricsRequest, RubricsResponse
+from app.schemas.rubrics import (
+    RubricsRequest,
+    RubricsResponse,
+    RubricsBatchRequest,
+    RubricsBatchResponse,
+    StoredRubricResponse,
+)
 from app.services.rubrics_service import generate_rubrics_service
+from app.core.inference import llm_executor
+from app.core.streaming import sse_response
 
 router = APIRouter(
     prefix = "/rubrics",
@@ -10,7 +18,7 @@ router = APIRouter(
 @router.post("/create", response_model= RubricsResponse)
 async def generate_rubrics(payload: RubricsRequest):
     
-    rubrics = generate_rubrics_service.generate(payload)
+    rubrics = await llm_executor.run(generate_rubrics_service.generate, payload)
 
     if not rubrics:
         raise HTTPException(
@@ -20,3 +28,37 @@ async def generate_rubrics(payload: RubricsRequest):
 
     return rubrics
 
+
+@router.post("/create/stream")
+async def generate_rubrics_stream(payload: RubricsRequest, include_tokens: bool = False):
+    """
+    SSE variant of /create: a `rubric` event per rubric point as soon as it
+    parses, then a `result` event with the full response (or an `error` event).
+    """
+    return sse_response(
+        llm_executor.stream(generate_rubrics_service.stream, payload, include_tokens)
+    )
+
+
+@router.post("/batch", response_model=RubricsBatchResponse)
+async def generate_rubrics_batch(payload: RubricsBatchRequest):
+    """
+    Rubrics for every question of an exam, generated in batched LLM passes
+    and kept in the rubric store; questions already stored skip the LLM.
+    """
+    return await llm_executor.run(generate_rubrics_service.generate_batch, payload)
+
+
+@router.get("/{rubric_id}", response_model=StoredRubricResponse)
+def get_stored_rubrics(rubric_id: str):
+    # plain def: the sqlite lookup runs on FastAPI's threadpool, not the event loop
+
+    rubrics = generate_rubrics_service.get_stored(rubric_id)
+
+    if rubrics is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Rubric not found"
+        )
+
+    return rubrics
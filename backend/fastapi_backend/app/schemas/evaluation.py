@@ -1,5 +1,5 @@
-from typing import Optional, Dict, Any, Annotated,List
-from pydantic import BaseModel, Field, StringConstraints
+from typing import Optional, Dict, Any, Annotated, List, Literal
+from pydantic import BaseModel, Field, StringConstraints, model_validator
 
 class EvaluateAnswer(BaseModel):
     # Use StringConstraints for whitespace stripping and length checks
@@ -12,9 +12,18 @@ class EvaluateAnswer(BaseModel):
     student_answer: Annotated[str, 
         StringConstraints(strip_whitespace=True, min_length=1, max_length=8000)
     ]
-    rubric: Annotated[List[str], 
-                      StringConstraints(min_length=1)]
+    rubric: Optional[Annotated[List[str], 
+                      StringConstraints(min_length=1)]] = None
+    # Rubric from the rubric store (/rubrics/create, /rubrics/batch) instead of `rubric`
+    rubric_id: Optional[Annotated[str,
+                                  StringConstraints(strip_whitespace=True, min_length=1)]] = None
     max_marks: Annotated[float, Field(ge=1, le=100)] = 10
+
+    @model_validator(mode="after")
+    def rubric_or_rubric_id(self):
+        if not self.rubric and not self.rubric_id:
+            raise ValueError("Either rubric or rubric_id is required")
+        return self
     
     # # Optional fields remain the same
     # reference_answer: Optional[str] = None
@@ -28,3 +37,49 @@ class EvaluateAnswerResponse(BaseModel):
     weakness: List[str]
     justification: str
     suggested_improvement: str
+
+    # Set when the grade was copied from a near-identical, already graded answer
+    reused: bool = False
+    reuse_similarity: Optional[float] = None
+
+    # Set when the pre-filter graded the answer without the LLM
+    prefilter_reason: Optional[Literal["empty", "too_short", "refusal"]] = None
+
+    # Cascade tier that produced the grade, when cascade grading is enabled
+    grading_tier: Optional[Literal["small", "large"]] = None
+
+
+class EvaluateBatchItem(EvaluateAnswer):
+    # Set when one batch carries answers from several attempts
+    attempt_id: Optional[Annotated[str,
+                                   StringConstraints(strip_whitespace=True, min_length=1)]] = None
+
+    def result_key(self) -> str:
+        if self.attempt_id:
+            return f"{self.attempt_id}:{self.question_id}"
+        return self.question_id
+
+
+class EvaluateBatchRequest(BaseModel):
+    answers: Annotated[List[EvaluateBatchItem],
+                       Field(min_length=1, max_length=500)]
+
+    @model_validator(mode="after")
+    def unique_keys(self):
+        keys = [item.result_key() for item in self.answers]
+        if len(keys) != len(set(keys)):
+            raise ValueError("Each (attempt_id, question_id) pair must appear only once")
+        return self
+
+
+class EvaluateBatchItemResponse(BaseModel):
+    question_id: str
+    attempt_id: Optional[str] = None
+    status: Literal["completed", "failed"]
+    result: Optional[EvaluateAnswerResponse] = None
+    error: Optional[str] = None
+
+
+class EvaluateBatchResponse(BaseModel):
+    # Keyed by question_id, or "attempt_id:question_id" when attempt_id is set
+    results: Dict[str, EvaluateBatchItemResponse]
@@ -1,5 +1,5 @@
-from typing import List, Dict, Annotated, Optional
-from pydantic import BaseModel, Field, StringConstraints
+from typing import List, Dict, Annotated, Optional, Literal
+from pydantic import BaseModel, Field, StringConstraints, model_validator
 
 class QuestionGenerationRequest(BaseModel):
 
@@ -14,6 +14,10 @@ class QuestionGenerationRequest(BaseModel):
     
     num_questions: Annotated[int,
                              Field(ge=1, le=100)]
+
+    # "Generate more": num_questions new questions, none of them already in
+    # the topic's question pool
+    more: bool = False
     
 
 class QuestionGenerationResponse(BaseModel):
@@ -26,6 +30,28 @@ class QuestionGenerationResponse(BaseModel):
     
     questions: Annotated[List[str],
                          Field(min_length=1)]
-    
-    
 
+
+class QuestionGenerationBatchRequest(BaseModel):
+    # One entry per (subject, topic) pair
+    topics: Annotated[List[QuestionGenerationRequest],
+                      Field(min_length=1, max_length=50)]
+
+    @model_validator(mode="after")
+    def unique_topic_ids(self):
+        ids = [request.topic_id for request in self.topics]
+        if len(ids) != len(set(ids)):
+            raise ValueError("Each topic_id must appear only once")
+        return self
+
+
+class QuestionGenerationBatchItemResponse(BaseModel):
+    topic_id: str
+    status: Literal["completed", "failed"]
+    result: Optional[QuestionGenerationResponse] = None
+    error: Optional[str] = None
+
+
+class QuestionGenerationBatchResponse(BaseModel):
+    # Keyed by topic_id
+    results: Dict[str, QuestionGenerationBatchItemResponse]
@@ -1,5 +1,5 @@
-from typing import List, Dict, Annotated, Optional
-from pydantic import BaseModel, Field, StringConstraints
+from typing import List, Dict, Annotated, Optional, Literal
+from pydantic import BaseModel, Field, StringConstraints, model_validator
 
 class RubricsRequest(BaseModel):
 
@@ -12,6 +12,9 @@ class RubricsRequest(BaseModel):
     max_marks: Annotated[int,
                          Field(ge=1, le=100)]
 
+    # generate a new rubric instead of returning the stored one (it replaces it)
+    regenerate: bool = False
+
 class RubricsResponse(BaseModel):
 
     question_id: Annotated[str,
@@ -23,3 +26,41 @@ class RubricsResponse(BaseModel):
     rubrics: Annotated[List[str],
                            StringConstraints(min_length=1)]
 
+    # ID in the rubric store; evaluation requests can send it instead of the rubric
+    rubric_id: Optional[str] = None
+
+
+class RubricsBatchRequest(BaseModel):
+    # Every question of one exam
+    exam_id: Optional[Annotated[str,
+                                StringConstraints(strip_whitespace=True, min_length=1)]] = None
+
+    questions: Annotated[List[RubricsRequest],
+                         Field(min_length=1, max_length=200)]
+
+    @model_validator(mode="after")
+    def unique_question_ids(self):
+        ids = [question.question_id for question in self.questions]
+        if len(ids) != len(set(ids)):
+            raise ValueError("Each question_id must appear only once")
+        return self
+
+
+class RubricsBatchItemResponse(BaseModel):
+    question_id: str
+    status: Literal["completed", "failed"]
+    result: Optional[RubricsResponse] = None
+    error: Optional[str] = None
+
+
+class RubricsBatchResponse(BaseModel):
+    exam_id: Optional[str] = None
+    # Keyed by question_id
+    results: Dict[str, RubricsBatchItemResponse]
+
+
+class StoredRubricResponse(BaseModel):
+    rubric_id: str
+    question_text: str
+    max_marks: float
+    rubrics: List[str]
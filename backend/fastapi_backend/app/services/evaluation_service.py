@@ -1,29 +1,189 @@
 from ai_ml.Evaluation import EvaluationEngine
-from app.schemas.evaluation import EvaluateAnswer
-from app.core import models   
+from ai_ml.CascadeEvaluation import CascadeEvaluator, RubricSimilarityScorer, SmallModelScorer
+from app.schemas.evaluation import EvaluateAnswer, EvaluateBatchRequest
+from fastapi import HTTPException
+from app.core import models
 from app.config import settings
 
-model_name = settings.HF_EVAL_MODEL_NAME
+model_name = settings.llm_model_id
+
+REQUIRED_KEYS = ["score", "strengths", "weakness",
+                 "justification", "suggested_improvement"]
 
 class EvaluationService:
 
+    def __init__(self):
+        self.engine = None
+        self.cascade = None
+
+    def load_engine(self):
+        """
+        Build the long-lived engine and its chain.
+        Called from lifespan once models.ai_model is loaded.
+        """
+        engine = EvaluationEngine(model_name=model_name, global_model=models.ai_model, cache=models.result_cache,
+                                  constrained=settings.LLM_CONSTRAINED_JSON,
+                                  max_new_tokens=settings.LLM_MAX_NEW_TOKENS,
+                                  pack_max_items=settings.EVAL_PACK_MAX_ITEMS,
+                                  pack_max_prompt_tokens=settings.EVAL_PACK_MAX_PROMPT_TOKENS)
+        engine.create_evaluation_chain()
+        if settings.EVAL_PACKING_ENABLED:
+            engine.create_packed_chain()
+
+        if settings.CASCADE_ENABLED:
+            self.cascade = CascadeEvaluator(
+                self._small_tier(),
+                engine,
+                confidence_threshold=settings.CASCADE_CONFIDENCE_THRESHOLD
+            )
+
+        self.engine = engine
+        return engine
+
+    def _small_tier(self):
+        # small local LLM when configured, rubric similarity otherwise
+        if settings.CASCADE_SMALL_MODEL_NAME:
+            small_engine = EvaluationEngine(
+                model_name=settings.CASCADE_SMALL_MODEL_NAME,
+                global_model=models.small_ai_model,
+                cache=models.result_cache,
+                constrained=settings.LLM_CONSTRAINED_JSON,
+                max_new_tokens=settings.LLM_MAX_NEW_TOKENS
+            )
+            small_engine.create_evaluation_chain()
+            return SmallModelScorer(small_engine)
+
+        return RubricSimilarityScorer(
+            models.st_model.get_model(),
+            high=settings.CASCADE_HIGH_SIMILARITY,
+            low=settings.CASCADE_LOW_SIMILARITY
+        )
+
+    def _grade(self, data):
+        engine = self.get_engine()
+        if self.cascade is not None:
+            return self.cascade.evaluate(data)
+        return engine.model_evaluator(data)
+
+    def _grade_batch(self, inputs):
+        engine = self.get_engine()
+        if self.cascade is not None:
+            return self.cascade.evaluate_batch(inputs)
+        if settings.EVAL_PACKING_ENABLED:
+            return engine.model_evaluator_packed(inputs)
+        return engine.model_evaluator_batch(inputs)
+
+    def get_engine(self):
+        return self.engine or self.load_engine()
+
+    def _validate(self, result):
+        if (
+            not result
+            or not isinstance(result, dict)
+            or any(k not in result for k in REQUIRED_KEYS)
+        ):
+            raise ValueError("Model returned invalid output.")
+
+    def _resolve_rubric(self, item):
+        """
+        Fill `rubric` from the rubric store when the request sent a rubric_id.
+        Raises KeyError when the ID is unknown.
+        """
+        if item.rubric or not item.rubric_id:
+            return
+
+        entry = models.rubric_store.get(item.rubric_id) if models.rubric_store is not None else None
+        if entry is None:
+            raise KeyError(f"Unknown rubric_id: {item.rubric_id}")
+
+        item.rubric = entry["rubrics"]
+        # marks the rubric was written for, unless the request set them
+        if "max_marks" not in item.model_fields_set:
+            item.max_marks = entry["max_marks"]
+
+    def _prefilter(self, data):
+        """
+        Deterministic grade for empty, refusal or repeated answers, else None.
+        """
+        prefilter = models.answer_prefilter
+        if prefilter is None:
+            return None
+
+        try:
+            return prefilter.check(data)
+        except Exception as e:
+            print("Prefilter error:", e)
+            return None
+
+    def _semantic_lookup(self, items):
+        """
+        Look every answer up in the semantic answer index (one encode call).
+        Returns a (question_key, embedding, hit) tuple per item, or None per
+        item when semantic reuse is disabled or the lookup fails.
+        """
+        index = models.answer_index
+        if index is None or not items:
+            return [None] * len(items)
+
+        try:
+            embeddings = index.embed([item.student_answer for item in items])
+
+            matches = []
+            for item, embedding in zip(items, embeddings):
+                key = index.question_key(item.question_text, item.rubric, item.max_marks)
+                matches.append((key, embedding, index.lookup(key, embedding)))
+            return matches
+
+        except Exception as e:
+            print("Semantic reuse error:", e)
+            return [None] * len(items)
+
+    def _reused_grade(self, hit, question_id):
+        grade, similarity = hit
+        grade["question_id"] = question_id
+        grade["reused"] = True
+        grade["reuse_similarity"] = round(similarity, 4)
+        return grade
+
+    def _remember(self, data, match, result):
+        if models.answer_prefilter is not None:
+            models.answer_prefilter.remember(data, result)
+
+        if match is not None:
+            key, embedding, _ = match
+            models.answer_index.add(key, embedding, result)
+
+    def _batch_entry(self, item, result=None, error=None):
+        return {
+            "question_id": item.question_id,
+            "attempt_id": item.attempt_id,
+            "status": "failed" if error is not None else "completed",
+            "result": result,
+            "error": error,
+        }
+
     def evaluate(self, payload: EvaluateAnswer):
+        try:
+            self._resolve_rubric(payload)
+        except KeyError as e:
+            raise HTTPException(status_code=404, detail=str(e.args[0]))
+
         data = payload.model_dump()
 
-        try:
-            # use models.ai_model loaded during lifespan
-      
-            result = EvaluationEngine(model_name=model_name, global_model=models.ai_model).model_evaluator(data)
+        prefiltered = self._prefilter(data)
+        if prefiltered is not None:
+            prefiltered["question_id"] = payload.question_id
+            return prefiltered
 
-            required_keys = ["score", "strengths", "weakness",
-                             "justification", "suggested_improvement"]
+        match = self._semantic_lookup([payload])[0]
+        if match is not None and match[2] is not None:
+            return self._reused_grade(match[2], payload.question_id)
 
-            if (
-                not result
-                or not isinstance(result, dict)
-                or any(k not in result for k in required_keys)
-            ):
-                raise ValueError("Model returned invalid output.")
+        try:
+            # engine (and models.ai_model) loaded during lifespan
+            result = self._grade(data)
+
+            self._validate(result)
 
         except Exception as e:
             print("Evaluation error:", e)
@@ -37,8 +197,56 @@ class EvaluationService:
                 "suggested_improvement": "Retry after the evaluator model loads successfully."
             }
 
+        self._remember(data, match, result)
+
         result["question_id"] = payload.question_id
         return result
 
+    def evaluate_batch(self, payload: EvaluateBatchRequest):
+        items = payload.answers
+        results = {item.result_key(): None for item in items}
+
+        remaining = []
+        for item in items:
+            try:
+                self._resolve_rubric(item)
+            except KeyError as e:
+                results[item.result_key()] = self._batch_entry(item, error=str(e.args[0]))
+                continue
+
+            prefiltered = self._prefilter(item.model_dump())
+            if prefiltered is not None:
+                prefiltered["question_id"] = item.question_id
+                results[item.result_key()] = self._batch_entry(item, prefiltered)
+            else:
+                remaining.append(item)
+
+        pending = []
+        for item, match in zip(remaining, self._semantic_lookup(remaining)):
+            if match is not None and match[2] is not None:
+                grade = self._reused_grade(match[2], item.question_id)
+                results[item.result_key()] = self._batch_entry(item, grade)
+            else:
+                pending.append((item, item.model_dump(), match))
+
+        # one engine, one chain and one batched pass over the LLM for the rest
+        outputs = []
+        if pending:
+            outputs = self._grade_batch([data for _, data, _ in pending])
+
+        for (item, data, match), result in zip(pending, outputs):
+            try:
+                self._validate(result)
+            except Exception as e:
+                print("Batch evaluation error:", item.result_key(), e)
+                results[item.result_key()] = self._batch_entry(item, error=str(e))
+                continue
+
+            self._remember(data, match, result)
+            result["question_id"] = item.question_id
+            results[item.result_key()] = self._batch_entry(item, result)
+
+        return {"results": results}
+
 
 evaluator_service = EvaluationService()
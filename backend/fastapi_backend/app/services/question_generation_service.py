@@ -1,30 +1,129 @@
-from app.schemas.question_generation import QuestionGenerationRequest
+from app.schemas.question_generation import QuestionGenerationRequest, QuestionGenerationBatchRequest
 from app.core import models
 from ai_ml.QuestionsGenerator import QuestionsGenerator
 from app.config import settings
 
-model_name = settings.HF_EVAL_MODEL_NAME
+model_name = settings.llm_model_id
+
+REQUIRED_KEYS = ["topic", "questions"]
+
+# generation rounds per topic when deduplication leaves questions missing
+POOL_ROUNDS = 2
 
 class QuestionGenerationService:
 
-    def generate(self, payload: QuestionGenerationRequest):
+    def __init__(self):
+        self.engine = None
+
+    def load_engine(self):
+        """
+        Build the long-lived generator and its chain.
+        Called from lifespan once models.ai_model is loaded.
+        """
+        engine = QuestionsGenerator(model_name=model_name, global_model=models.ai_model, cache=models.result_cache,
+                                    constrained=settings.LLM_CONSTRAINED_JSON,
+                                    max_new_tokens=settings.LLM_MAX_NEW_TOKENS)
+        engine.chain_creator()
+        self.engine = engine
+        return engine
+
+    def get_engine(self):
+        return self.engine or self.load_engine()
 
-        data = payload.model_dump()
+    def _pool_key(self, payload: QuestionGenerationRequest):
+        pool = models.question_pool
+        if pool is None:
+            return None
+        return pool.topic_key(payload.subject, payload.topic)
 
+    def _pooled(self, key):
+        if key is None:
+            return []
         try:
+            return models.question_pool.questions(key)
+        except Exception as e:
+            print("Question pool error:", e)
+            return []
+
+    def _accept(self, key, questions):
+        """
+        Generated questions that are not duplicates of the topic's pool.
+        """
+        if key is None:
+            return list(questions)
+        try:
+            return models.question_pool.add(key, questions)
+        except Exception as e:
+            print("Question pool error:", e)
+            return list(questions)
+
+    def _missing(self, payload: QuestionGenerationRequest, state: dict) -> int:
+        have = len(state["new"]) if payload.more else len(state["pooled"]) + len(state["new"])
+        return payload.num_questions - have
 
-            # Use models.ai_model loaded during lifespan
+    def _engine_input(self, payload: QuestionGenerationRequest, state: dict) -> dict:
+        data = payload.model_dump(exclude={"more"})
+        data["num_questions"] = self._missing(payload, state)
+        # shown to the model so it does not repeat them
+        data["existing_questions"] = state["pooled"] + state["new"]
+        return data
 
-            result = QuestionsGenerator(model_name=model_name, global_model=models.ai_model).create_questions(data)
+    def _generate_all(self, payloads):
+        """
+        Pooled questions first, then one batched LLM pass per round for the
+        topics still short of questions. Returns a state dict per payload.
+        """
+        states = []
+        for payload in payloads:
+            key = self._pool_key(payload)
+            states.append({"key": key, "pooled": self._pooled(key), "new": [], "error": None})
 
-            required_keys = ["topic", "questions"]
+        rounds = POOL_ROUNDS if models.question_pool is not None else 1
+        for _ in range(rounds):
+            pending = [
+                (payload, state) for payload, state in zip(payloads, states)
+                if state["error"] is None and self._missing(payload, state) > 0
+            ]
+            if not pending:
+                break
+
+            # Generator (and models.ai_model) loaded during lifespan
+            outputs = self.get_engine().create_questions_batch(
+                [self._engine_input(payload, state) for payload, state in pending]
+            )
+
+            for (payload, state), result in zip(pending, outputs):
+                if (
+                    not result
+                    or not isinstance(result, dict)
+                    or any(k not in result for k in REQUIRED_KEYS)
+                ):
+                    state["error"] = "Model returned invalid output."
+                    continue
+
+                state["new"] += self._accept(state["key"], result["questions"])
+
+        return states
+
+    def _response(self, payload: QuestionGenerationRequest, state: dict) -> dict:
+        questions = state["new"] if payload.more else state["pooled"] + state["new"]
+        questions = questions[:payload.num_questions]
+
+        if not questions:
+            raise ValueError(state["error"] or "No new questions could be generated.")
+
+        return {
+            "topic_id": payload.topic_id,
+            "topic": payload.topic,
+            "questions": questions,
+        }
+
+    def generate(self, payload: QuestionGenerationRequest):
 
-            if (
-                not result 
-                or not isinstance(result, dict)
-                or any(k not in result for k in required_keys)
-            ):
-                raise ValueError("Model returned invalid output.")
+        try:
+
+            state = self._generate_all([payload])[0]
+            result = self._response(payload, state)
             
         except Exception as e:
             
@@ -36,7 +135,76 @@ class QuestionGenerationService:
                 "questions": ["No questions could be generated due to model error"]
             }
 
-        result["topic_id"] = payload.topic_id
         return result
 
+    def generate_batch(self, payload: QuestionGenerationBatchRequest):
+        results = {}
+        states = self._generate_all(payload.topics)
+
+        for request, state in zip(payload.topics, states):
+            try:
+                result = self._response(request, state)
+            except Exception as e:
+                print("Batch generation error:", request.topic_id, e)
+                results[request.topic_id] = self._batch_entry(request, error=str(e))
+                continue
+
+            results[request.topic_id] = self._batch_entry(request, result)
+
+        return {"results": results}
+
+    def _batch_entry(self, request, result=None, error=None):
+        return {
+            "topic_id": request.topic_id,
+            "status": "failed" if error is not None else "completed",
+            "result": result,
+            "error": error,
+        }
+
+    def stream(self, payload: QuestionGenerationRequest, include_tokens: bool = False):
+        """
+        Same pool-first rules as generate(): pooled questions are sent first,
+        then generated ones as each parses and passes deduplication.
+        Yields ("question", {...}) per question, then ("result", {...}).
+        Yields ("error", {...}) instead of raising once the stream has started.
+        """
+        key = self._pool_key(payload)
+        state = {"key": key, "pooled": self._pooled(key), "new": [], "error": None}
+        index = 0
+
+        try:
+            if not payload.more:
+                for question in state["pooled"][:payload.num_questions]:
+                    yield "question", {"index": index, "question": question}
+                    index += 1
+
+            rounds = POOL_ROUNDS if models.question_pool is not None else 1
+            for _ in range(rounds):
+                if self._missing(payload, state) <= 0:
+                    break
+
+                data = self._engine_input(payload, state)
+                for event, value in self.get_engine().stream_questions(data):
+                    if event == "token":
+                        if include_tokens:
+                            yield "token", {"text": value}
+
+                    elif event == "question" and self._missing(payload, state) > 0:
+                        # near-duplicates of the pool are dropped as they arrive
+                        added = self._accept(key, [value])
+                        if added:
+                            state["new"] += added
+                            yield "question", {"index": index, "question": added[0]}
+                            index += 1
+
+                    elif event == "result":
+                        if not isinstance(value, dict) or any(k not in value for k in REQUIRED_KEYS):
+                            raise ValueError("Model returned invalid output.")
+
+            yield "result", self._response(payload, state)
+
+        except Exception as e:
+            print("Generation error: ", e)
+            yield "error", {"detail": "Model failed to generate questions"}
+
 generation_service = QuestionGenerationService()
\ No newline at end of file
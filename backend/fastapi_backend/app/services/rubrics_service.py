@@ -1,34 +1,93 @@
-from app.schemas.rubrics import RubricsRequest
+from app.schemas.rubrics import RubricsRequest, RubricsBatchRequest
 from app.core import models
 from ai_ml.Rubrics import RubricsEngine
 from app.config import settings
 from fastapi import HTTPException
 
-model_name = settings.HF_EVAL_MODEL_NAME
+model_name = settings.llm_model_id
 
 class RubricsService:
-    def generate(self, payload: RubricsRequest):
+    def __init__(self):
+        self.engine = None
 
-        data = payload.model_dump()
+    def load_engine(self):
+        """
+        Build the long-lived rubrics engine and its chain.
+        Called from lifespan once models.ai_model is loaded.
+        """
+        engine = RubricsEngine(model_name=model_name, global_model=models.ai_model, cache=models.result_cache,
+                               constrained=settings.LLM_CONSTRAINED_JSON,
+                               max_new_tokens=settings.LLM_MAX_NEW_TOKENS)
+        engine.create_rubrics_chain()
+        self.engine = engine
+        return engine
 
-        try: 
-            
-            # Use models.ai_model loaded during lifespan
+    def get_engine(self):
+        return self.engine or self.load_engine()
+
+    def _stored(self, payload: RubricsRequest):
+        """
+        Rubrics already generated for this question text and marks, else None.
+        """
+        store = models.rubric_store
+        if store is None or payload.regenerate:
+            return None
+
+        try:
+            entry = store.lookup(payload.question_text, payload.max_marks)
+        except Exception as e:
+            print("Rubric store error:", e)
+            return None
+
+        if entry is None:
+            return None
+
+        return {
+            "question_id": payload.question_id,
+            "question_text": payload.question_text,
+            "rubrics": entry["rubrics"],
+            "rubric_id": entry["rubric_id"],
+        }
+
+    def _store(self, payload: RubricsRequest, result: dict):
+        store = models.rubric_store
+        if store is None:
+            return
 
-            result = RubricsEngine(model_name=model_name, global_model=models.ai_model).create_rubrics(data)
+        try:
+            result["rubric_id"] = store.put(payload.question_text, payload.max_marks, result["rubrics"])
+        except Exception as e:
+            print("Rubric store error:", e)
+
+    def _check_result(self, result):
+        # Accept dict or pydantic model-like object
+        if not result:
+            raise ValueError("Model returned empty result.")
+
+        required_keys = ["question_text", "rubrics"]
+
+        # If it's a pydantic model instance, convert to dict
+        if not isinstance(result, dict) and hasattr(result, "model_dump"):
+            result = result.model_dump()
+
+        if not isinstance(result, dict) or any(k not in result for k in required_keys):
+            raise ValueError("Model returned invalid output: missing required keys.")
 
-            # Accept dict or pydantic model-like object
-            if not result:
-                raise ValueError("Model returned empty result.")
+        return result
+
+    def generate(self, payload: RubricsRequest):
 
-            required_keys = ["question_text", "rubrics"]
+        stored = self._stored(payload)
+        if stored is not None:
+            return stored
+
+        data = payload.model_dump()
 
-            # If it's a pydantic model instance, convert to dict
-            if not isinstance(result, dict) and hasattr(result, "model_dump"):
-                result = result.model_dump()
+        try: 
+            
+            # Engine (and models.ai_model) loaded during lifespan
 
-            if not isinstance(result, dict) or any(k not in result for k in required_keys):
-                raise ValueError("Model returned invalid output: missing required keys.")
+            result = self._check_result(self.get_engine().create_rubrics(data))
                 
         except Exception as e:
             
@@ -40,6 +99,93 @@ class RubricsService:
             )
         
         result["question_id"] = payload.question_id
+        self._store(payload, result)
         return result
 
+    def _batch_entry(self, question, result=None, error=None):
+        return {
+            "question_id": question.question_id,
+            "status": "failed" if error is not None else "completed",
+            "result": result,
+            "error": error,
+        }
+
+    def generate_batch(self, payload: RubricsBatchRequest):
+        questions = payload.questions
+        results = {}
+
+        pending = []
+        for question in questions:
+            stored = self._stored(question)
+            if stored is not None:
+                results[question.question_id] = self._batch_entry(question, stored)
+            else:
+                pending.append(question)
+
+        # one engine, one chain and one batched pass over the LLM for the rest
+        outputs = []
+        if pending:
+            outputs = self.get_engine().create_rubrics_batch([q.model_dump() for q in pending])
+
+        for question, result in zip(pending, outputs):
+            try:
+                result = self._check_result(result)
+            except Exception as e:
+                print("Batch rubrics generation error:", question.question_id, e)
+                results[question.question_id] = self._batch_entry(question, error=str(e))
+                continue
+
+            result["question_id"] = question.question_id
+            self._store(question, result)
+            results[question.question_id] = self._batch_entry(question, result)
+
+        # same order as the request
+        return {
+            "exam_id": payload.exam_id,
+            "results": {q.question_id: results[q.question_id] for q in questions},
+        }
+
+    def get_stored(self, rubric_id: str):
+        store = models.rubric_store
+        if store is None:
+            return None
+        return store.get(rubric_id)
+
+    def stream(self, payload: RubricsRequest, include_tokens: bool = False):
+        """
+        Yields ("rubric", {...}) as each rubric point parses, then ("result", {...}).
+        Yields ("error", {...}) instead of raising once the stream has started.
+        """
+        stored = self._stored(payload)
+        if stored is not None:
+            for index, rubric in enumerate(stored["rubrics"]):
+                yield "rubric", {"index": index, "rubric": rubric}
+            yield "result", stored
+            return
+
+        data = payload.model_dump()
+        index = 0
+
+        try:
+            for event, value in self.get_engine().stream_rubrics(data):
+                if event == "token":
+                    if include_tokens:
+                        yield "token", {"text": value}
+
+                elif event == "rubric":
+                    yield "rubric", {"index": index, "rubric": value}
+                    index += 1
+
+                elif event == "result":
+                    if not isinstance(value, dict) or any(k not in value for k in ["question_text", "rubrics"]):
+                        raise ValueError("Model returned invalid output: missing required keys.")
+
+                    value["question_id"] = payload.question_id
+                    self._store(payload, value)
+                    yield "result", value
+
+        except Exception as e:
+            print("Rubrics generation error: ", e)
+            yield "error", {"detail": "Rubrics generation failed due to model error"}
+
 generate_rubrics_service = RubricsService()
@@ -1,64 +1,47 @@
-import os
-from tempfile import NamedTemporaryFile
 from fastapi import UploadFile, HTTPException
 
 from ai_ml.Speech2Text import STT
+from ai_ml.Cancellation import GenerationCancelled
 from app.config import settings
-from app.core import models   
+from app.core import models
+from app.core.inference import whisper_executor
 
 
 async def transcribe(audio: UploadFile, lang="en", model=None):
     model = model or settings.STT_DEFAULT_MODEL  # usually "whisper"
 
-    suffix = os.path.splitext(audio.filename or "")[-1] or ".wav"
-    with NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        tmp.write(await audio.read())
-        tmp_path = tmp.name
+    if model.lower() not in ("whisper", "hf"):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid STT model '{model}'. Choose 'whisper' or 'hf'."
+        )
 
-    stt = STT(lang=lang, model=model, audio_file_name=tmp_path)
+    # decoded once in memory (ffmpeg stdin or soundfile), no temp file
+    stt = STT(lang=lang, model=model, audio_file_name=audio.filename or "upload",
+              audio_bytes=await audio.read(), batch_size=settings.STT_BATCH_SIZE,
+              chunk_overlap_sec=settings.STT_CHUNK_OVERLAP_SEC)
 
     if model.lower() == "whisper":
         try:
             # fetch model from global module (updated by lifespan)
-            text = stt.transcribe_with_existing_model(
+            text = await whisper_executor.run(
+                stt.transcribe_with_existing_model,
                 models.whisper_model,
-                audio_file_path=tmp_path,
                 lang=lang
             )
+        except GenerationCancelled:
+            raise
         except Exception as e:
-            try:
-                os.remove(tmp_path)
-            except:
-                pass
             raise HTTPException(500, f"Whisper transcription failed: {str(e)}")
 
-    elif model.lower() == "hf":
-        stt.transcribe()
-        text = stt.transcription_list[0] if stt.transcription_list else ""
-
     else:
-        try:
-            os.remove(tmp_path)
-        except:
-            pass
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid STT model '{model}'. Choose 'whisper' or 'hf'."
-        )
+        await whisper_executor.run(stt.transcribe)
+        text = stt.transcription_list[0] if stt.transcription_list else ""
 
     if not text:
-        try:
-            os.remove(tmp_path)
-        except:
-            pass
         raise HTTPException(
             status_code=500,
             detail="Speech-to-text failed. No transcription returned."
         )
 
-    try:
-        os.remove(tmp_path)
-    except:
-        pass
-
     return text
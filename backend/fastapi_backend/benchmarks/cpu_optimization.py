@@ -0,0 +1,91 @@
+"""
+Load time, memory and generation latency of the LLM per CPU optimization mode.
+
+Each mode runs in a fresh process so resident memory is not shared between
+them. Reported per mode: load seconds, resident and peak memory after the
+load, and the median latency of an evaluation-sized prompt (first call
+excluded, it pays one-off warm-up).
+
+USAGE :
+--------------------------------
+cd backend/fastapi_backend
+python benchmarks/cpu_optimization.py                                   # "", bf16, int8
+python benchmarks/cpu_optimization.py --model microsoft/Phi-3.5-mini-instruct --modes int8 --runs 5
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROMPT = """
+You are a very strict exam evaluation engine.
+Return ONLY valid JSON with the keys score, strengths, weakness, justification, suggested_improvement.
+
+Rubric:
+["Defines photosynthesis", "Names chlorophyll", "Gives the balanced equation"]
+
+Question:
+Explain photosynthesis.
+
+Student Answer:
+Plants use sunlight and chlorophyll to turn carbon dioxide and water into glucose and oxygen.
+
+Maximum Marks: 5
+"""
+
+
+def measure(model_name: str, mode: str, runs: int, max_new_tokens: int) -> dict:
+    from ai_ml.ModelCreator import HFModelCreation
+
+    llm = HFModelCreation.hf_model_creator(model_name, max_new_tokens=max_new_tokens, cpu_optimization=mode)
+    if llm is None:
+        return {"mode": mode or "none", "error": "model failed to load"}
+
+    report = dict(HFModelCreation.load_reports[model_name])
+    # ru_maxrss is in KB on Linux
+    report["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    latencies = []
+    for _ in range(runs + 1):
+        started = time.perf_counter()
+        llm.invoke(PROMPT)
+        latencies.append(time.perf_counter() - started)
+
+    report["median_latency_s"] = round(statistics.median(latencies[1:]), 2)
+    report["first_call_s"] = round(latencies[0], 2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="microsoft/Phi-3.5-mini-instruct")
+    parser.add_argument("--modes", nargs="+", default=["", "bf16", "int8"])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--max-new-tokens", type=int, default=256)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.model, args.modes[0], args.runs, args.max_new_tokens)))
+        return
+
+    for mode in args.modes:
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", "--model", args.model,
+             "--modes", mode, "--runs", str(args.runs), "--max-new-tokens", str(args.max_new_tokens)],
+            capture_output=True, text=True,
+        )
+        lines = proc.stdout.strip().splitlines()
+        print(lines[-1] if proc.returncode == 0 and lines else
+              json.dumps({"mode": mode or "none", "error": proc.stderr.strip()[-500:]}))
+
+
+if __name__ == "__main__":
+    main()
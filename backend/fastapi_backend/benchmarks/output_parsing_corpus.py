@@ -0,0 +1,137 @@
+"""
+Malformed LLM output corpus for ai_ml.OutputParsing.
+
+The built-in corpus is synthetic: hand-written failure cases modelled on the
+ways the models break JSON (fences, trailing commas, missing commas, raw
+newlines, unquoted keys, Python literals, stray or missing closers), plus
+every truncation point of three well-formed outputs (evaluation, rubrics,
+packed evaluation). For each case it reports whether an object was recovered
+and, for truncations, whether every recovered field matches the original (a
+cut-off string may only be shortened).
+
+Captured outputs can be added with --captured: a JSONL file with one raw
+model output per line, as a JSON string.
+
+USAGE :
+--------------------------------
+cd backend/fastapi_backend
+python benchmarks/output_parsing_corpus.py
+python benchmarks/output_parsing_corpus.py --captured captured_outputs.jsonl
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_ml.OutputParsing import parse_json_object
+
+EVALUATION = json.dumps({
+    "score": 3.5,
+    "strengths": ["Defines photosynthesis", "Names chlorophyll"],
+    "weakness": ["No equation"],
+    "justification": "Covers two of the three rubric points.\nMisses the balanced equation.",
+    "suggested_improvement": "Add 6CO2 + 6H2O -> C6H12O6 + 6O2.",
+}, indent=2)
+
+RUBRICS = json.dumps({
+    "question_id": "q-12",
+    "question_text": "Explain the role of the électron transport chain.",
+    "rubrics": ["Mentions NADH/FADH2", "Proton gradient", "ATP synthase", "Oxygen as final acceptor"],
+})
+
+PACKED = json.dumps({
+    "results": [
+        {"item": 1, "score": 2, "strengths": ["Correct"], "weakness": [],
+         "justification": "Right answer.", "suggested_improvement": "None."},
+        {"item": 2, "score": 0, "strengths": [], "weakness": ["Wrong unit"],
+         "justification": "Uses grams, not moles.", "suggested_improvement": "Convert units."},
+        {"item": 3, "score": 1, "strengths": ["Partial"], "weakness": ["No example"],
+         "justification": "Half of the rubric.", "suggested_improvement": "Give an example."},
+    ]
+})
+
+MALFORMED = [
+    ("code fence", '```json\n{"score": 4, "justification": "ok"}\n```'),
+    ("chatter around", 'Here is the grade:\n{"score": 4, "justification": "ok"}\nHope this helps!'),
+    ("trailing comma", '{"score": 4, "strengths": ["a", "b",], }'),
+    ("missing comma", '{"score": 4 "justification": "ok"}'),
+    ("missing comma in array", '{"strengths": ["a" "b"]}'),
+    ("missing comma after object", '{"results": [{"item": 1} {"item": 2}]}'),
+    ("raw newline in string", '{"justification": "line one\nline two"}'),
+    ("raw tab in string", '{"justification": "a\tb"}'),
+    ("unquoted keys", '{score: 4, justification: "ok"}'),
+    ("python literals", '{"score": 4, "passed": True, "note": None}'),
+    ("stray closer", '{"score": 4]}'),
+    ("missing array closer", '{"strengths": ["a", "b"}'),
+    ("missing colon", '{"score" 4}'),
+    ("double comma", '{"score": 4,, "justification": "ok"}'),
+    ("dangling key", '{"score": 4, "justification": }'),
+    ("no json", 'I cannot grade this answer.'),
+]
+
+
+def truncations(text: str):
+    for cut in range(text.find("{") + 1, len(text)):
+        yield text[:cut]
+
+
+def intact(recovered, original) -> bool:
+    """Every recovered value equals the original one or is a cut-off prefix of it."""
+    if isinstance(original, dict):
+        return isinstance(recovered, dict) and all(
+            key in original and intact(value, original[key]) for key, value in recovered.items()
+        )
+    if isinstance(original, list):
+        return isinstance(recovered, list) and len(recovered) <= len(original) and all(
+            intact(value, original[i]) for i, value in enumerate(recovered)
+        )
+    if isinstance(original, str):
+        return isinstance(recovered, str) and original.startswith(recovered)
+    return recovered == original
+
+
+def try_parse(text: str):
+    try:
+        return parse_json_object(text)
+    except ValueError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--captured", help="JSONL file, one raw model output (JSON string) per line")
+    args = parser.parse_args()
+
+    print("malformed cases")
+    recovered = 0
+    for name, text in MALFORMED:
+        obj = try_parse(text)
+        recovered += obj is not None
+        print(f"  {'ok  ' if obj is not None else 'FAIL'} {name}")
+    print(f"  recovered {recovered}/{len(MALFORMED)} (the 'no json' case cannot be)")
+
+    print("truncated output")
+    for name, text in (("evaluation", EVALUATION), ("rubrics", RUBRICS), ("packed", PACKED)):
+        original = json.loads(text)
+        cases = list(truncations(text))
+        started = time.perf_counter()
+        results = [try_parse(case) for case in cases]
+        elapsed_us = (time.perf_counter() - started) * 1e6 / len(cases)
+
+        parsed = sum(r is not None for r in results)
+        exact = sum(r is not None and intact(r, original) for r in results)
+        print(f"  {name:<11} parsed {parsed}/{len(cases)}, intact {exact}/{len(cases)}, {elapsed_us:.0f} us/case")
+
+    if args.captured:
+        with open(args.captured, encoding="utf-8") as f:
+            outputs = [json.loads(line) for line in f if line.strip()]
+        parsed = sum(try_parse(output) is not None for output in outputs)
+        print(f"captured outputs\n  parsed {parsed}/{len(outputs)}")
+
+
+if __name__ == "__main__":
+    main()